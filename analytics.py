@@ -0,0 +1,141 @@
+"""Аналитика расходов: суммы по категориям за дни, недели и месяцы.
+
+Суммы за месяцы берутся из сводной таблицы buy_summary, за дни и недели —
+из buy по диапазону индекса (id_user, date) с группировкой по дням на стороне
+базы. Дальше ряд раскладывается по периодам, пустые периоды заполняются нулями,
+считаются скользящее среднее и изменение к предыдущему периоду.
+"""
+from datetime import date, timedelta
+
+from database import month_start, next_month
+from money import KOPECK, ZERO
+
+PERIODS = ("day", "week", "month")
+
+# Сколько периодов показывать по умолчанию и окно скользящего среднего
+DEFAULT_LENGTH = {"day": 30, "week": 12, "month": 12}
+DEFAULT_WINDOW = {"day": 7, "week": 4, "month": 3}
+
+
+def period_start(day, period):
+    """Начало периода, в который попадает дата: сама дата, понедельник недели или первое число."""
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return month_start(day)
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def next_period(start, period):
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    return next_month(start)
+
+
+def period_range(start, end, period):
+    """Начала всех периодов, пересекающих даты от start до end включительно."""
+    periods = []
+    current = period_start(start, period)
+    while current <= end:
+        periods.append(current)
+        current = next_period(current, period)
+    return periods
+
+
+def default_range(period, today=None):
+    """Последние DEFAULT_LENGTH[period] периодов, включая текущий."""
+    today = today or date.today()
+    start = period_start(today, period)
+    for _ in range(DEFAULT_LENGTH[period] - 1):
+        start = period_start(start - timedelta(days=1), period)
+    return start, today
+
+
+def running_average(values, window):
+    """Скользящее среднее за window последних значений (в начале ряда — за сколько есть)."""
+    averages = []
+    total = ZERO
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        averages.append((total / min(i + 1, window)).quantize(KOPECK))
+    return averages
+
+
+def changes(values):
+    """Изменение к предыдущему значению: (разница, доля) или None для первого значения.
+
+    Доля — None, если предыдущее значение нулевое.
+    """
+    result = [None] if values else []
+    for previous, current in zip(values, values[1:]):
+        delta = current - previous
+        result.append((delta, delta / previous if previous else None))
+    return result
+
+
+class SpendReport:
+    """Расходы по категориям за последовательные периоды.
+
+    periods — начала периодов; categories — {название категории: суммы по периодам}
+    (None — записи без категории); totals, entries — итоги по периодам;
+    average — скользящее среднее итогов; deltas — изменение итога к предыдущему периоду
+    (для месяцев — месяц к месяцу). Суммы — Decimal рублей.
+    """
+
+    def __init__(self, period, periods, categories, totals, entries, window):
+        self.period = period
+        self.periods = periods
+        self.categories = categories
+        self.totals = totals
+        self.entries = entries
+        self.window = window
+        self.average = running_average(totals, window)
+        self.deltas = changes(totals)
+
+    def category_deltas(self):
+        """Изменение расходов по каждой категории в последнем периоде к предыдущему.
+
+        Возвращает список (категория, сумма в последнем периоде, разница, доля),
+        отсортированный по убыванию суммы.
+        """
+        result = []
+        for name, values in self.categories.items():
+            delta = changes(values[-2:])[-1] if len(values) >= 2 else None
+            result.append((name, values[-1] if values else ZERO, *(delta or (None, None))))
+        return sorted(result, key=lambda item: item[1], reverse=True)
+
+
+def build_report(rows, start, end, period, window=None):
+    """Собирает SpendReport из строк DB.get_spend_series (начало периода или день, категория, сумма, записей)."""
+    periods = period_range(start, end, period)
+    index = {day: i for i, day in enumerate(periods)}
+    categories = {}
+    totals = [ZERO] * len(periods)
+    entries = [0] * len(periods)
+    for day, category, total, count in rows:
+        i = index.get(period_start(day, period))
+        if i is None:
+            continue
+        values = categories.get(category)
+        if values is None:
+            values = categories[category] = [ZERO] * len(periods)
+        values[i] += total
+        totals[i] += total
+        entries[i] += count
+    return SpendReport(period, periods, categories, totals, entries, window or DEFAULT_WINDOW[period])
+
+
+def spend_report(db, user_id, period="month", start=None, end=None, window=None):
+    """Отчет о расходах пользователя; без start и end — за последние DEFAULT_LENGTH[period] периодов."""
+    if period not in PERIODS:
+        raise ValueError(f"Неизвестный период: {period}")
+    if start is None or end is None:
+        start, end = default_range(period, end)
+    rows = db.get_spend_series(user_id, start, end, "month" if period == "month" else "day")
+    return build_report(rows, start, end, period, window)
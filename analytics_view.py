@@ -0,0 +1,127 @@
+import flet as ft
+
+from updates import request_update
+
+PERIOD_LABELS = {"day": "По дням", "week": "По неделям", "month": "По месяцам"}
+
+# Цвета категорий на графике, по порядку убывания расходов
+CATEGORY_COLORS = ("#F4D35E", "#EE964B", "#F95738", "#0D3B66", "#83C5BE", "#B5838D", "#6D6875")
+
+
+def period_label(day, period):
+    if period == "month":
+        return day.strftime("%m.%y")
+    return day.strftime("%d.%m")
+
+
+def format_delta(delta, share):
+    if delta is None:
+        return "нет данных за прошлый период"
+    text = f"{delta:+.2f} руб."
+    if share is not None:
+        text += f" ({share:+.0%})"
+    return text
+
+
+class AnalyticsView:
+    """Окно аналитики: расходы по категориям за периоды в виде столбчатой диаграммы.
+
+    Столбец периода разбит на категории; под диаграммой — скользящее среднее
+    и изменение расходов по категориям к предыдущему периоду.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.period = "month"
+        self.dialog = None
+
+    def build(self):
+        view = self.view
+        self.period_dropdown = ft.Dropdown(
+            value=self.period,
+            options=[ft.dropdown.Option(key, label) for key, label in PERIOD_LABELS.items()],
+            border_color=view.secondary_color,
+            color=view.text_color,
+            width=200,
+            on_change=self.handle_period_change)
+        self.chart = ft.BarChart(
+            left_axis=ft.ChartAxis(labels_size=60),
+            bottom_axis=ft.ChartAxis(labels_size=32),
+            horizontal_grid_lines=ft.ChartGridLines(color=view.secondary_color, width=1, dash_pattern=[3, 3]),
+            tooltip_bgcolor=view.card_color,
+            expand=True)
+        self.legend = ft.Row(wrap=True, spacing=12)
+        self.summary = ft.Column(spacing=4)
+        self.dialog = ft.AlertDialog(
+            title=ft.Text("Аналитика расходов", color=view.text_color, weight=ft.FontWeight.BOLD),
+            content=ft.Container(
+                content=ft.Column(
+                    [self.period_dropdown, ft.Container(self.chart, height=300), self.legend, self.summary],
+                    scroll=ft.ScrollMode.AUTO),
+                width=700),
+            actions=[ft.TextButton("Закрыть", on_click=lambda e: self.close())],
+            bgcolor=view.background_color)
+
+    async def handle_period_change(self, e):
+        self.period = self.period_dropdown.value
+        await self.view.controller.analytics_command(e)
+
+    def show(self, report):
+        if self.dialog is None:
+            self.build()
+        self.fill(report)
+        # Окно открывается тем же обновлением страницы, что и его содержимое
+        # (page.open() отправил бы клиенту отдельное обновление)
+        page = self.view.page
+        if not any(control is self.dialog for control in page.overlay):
+            page.overlay.append(self.dialog)
+        self.dialog.open = True
+        request_update(page)
+
+    def close(self):
+        self.dialog.open = False
+        request_update(self.view.page)
+
+    def fill(self, report):
+        view = self.view
+        order = sorted(report.categories, key=lambda name: sum(report.categories[name]), reverse=True)
+        colors = {name: CATEGORY_COLORS[i % len(CATEGORY_COLORS)] for i, name in enumerate(order)}
+
+        groups = []
+        for i, (day, total) in enumerate(zip(report.periods, report.totals)):
+            stack = []
+            level = 0.0
+            for name in order:
+                value = report.categories[name][i]
+                if value:
+                    stack.append(ft.BarChartRodStackItem(level, level + float(value), colors[name]))
+                    level += float(value)
+            groups.append(ft.BarChartGroup(
+                x=i,
+                bar_rods=[ft.BarChartRod(
+                    from_y=0,
+                    to_y=float(total),
+                    width=12 if report.period == "day" else 20,
+                    rod_stack_items=stack,
+                    tooltip=f"{period_label(day, report.period)}: {total:.2f} руб.",
+                    border_radius=2)]))
+        self.chart.bar_groups = groups
+        self.chart.max_y = float(max(report.totals, default=0)) * 1.1 or 1
+        step = max(1, len(report.periods) // 10)
+        self.chart.bottom_axis.labels = [
+            ft.ChartAxisLabel(value=i, label=ft.Text(period_label(day, report.period), size=10, color=view.text_color))
+            for i, day in enumerate(report.periods) if i % step == 0]
+
+        self.legend.controls = [
+            ft.Row([ft.Container(width=12, height=12, bgcolor=colors[name], border_radius=2),
+                    ft.Text(name or "Без категории", size=12, color=view.text_color)], spacing=4)
+            for name in order]
+
+        lines = []
+        if report.periods:
+            lines.append(f"За последний период: {report.totals[-1]:.2f} руб., "
+                         f"{format_delta(*(report.deltas[-1] or (None, None)))}")
+            lines.append(f"Скользящее среднее (окно {report.window}): {report.average[-1]:.2f} руб.")
+        for name, amount, delta, share in report.category_deltas():
+            lines.append(f"{name or 'Без категории'}: {amount:.2f} руб., {format_delta(delta, share)}")
+        self.summary.controls = [ft.Text(line, size=14, color=view.text_color) for line in lines]
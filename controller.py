@@ -1,7 +1,40 @@
-from datetime import datetime
+import asyncio
+from datetime import date
+
+from analytics import spend_report
+from backends import Error
+
+from database import PAGE_SIZE, RECURRING_PERIODS, UserExists
+from exporter import export_file
+from instrumentation import command
+from money import parse_money
+from outbox import OperationRejected
+from sessions import SessionStore
+from updates import batched, flush_updates, request_update
+
+# Пауза после последнего нажатия клавиши перед живым поиском, в секундах
+SEARCH_DEBOUNCE = 0.3
+
+# Ключ токена сессии в хранилище браузера
+SESSION_KEY = "budget.session"
 
 class BudgetController:
-    def __init__(self, model, view, registration_view=None):
+    """Контроллер приложения.
+
+    model — AsyncDB: запросы к базе выполняются в пуле потоков, а команды
+    контроллера являются корутинами, которые Flet выполняет в цикле событий.
+    Команды отмечены декоратором @command, поэтому в замерах запросов
+    (DB.query_log) видно, какая команда их вызвала. Декоратор @batched
+    откладывает обновления страницы до конца команды: за одно действие
+    пользователя клиенту уходит одно обновление (см. updates).
+
+    Контроллер и представления создаются на каждую сессию Flet, поэтому выбранные
+    записи, фильтры и вошедший пользователь у сессий свои; общими остаются только
+    model (пул подключений, которые выдаются на время запроса), sessions —
+    хранилище токенов входа — и writes, очередь изменений на случай недоступной базы.
+    """
+
+    def __init__(self, model, view, registration_view=None, sessions=None, writes=None, startup=None):
         self.model = model
         self.view = view
         self.registration_view = registration_view
@@ -9,8 +42,24 @@ class BudgetController:
         if self.registration_view:
             self.registration_view.controller = self
         self.current_page = None
+        # id вошедшего пользователя; None — записи без владельца
+        self.user_id = None
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.session_token = None
+        # Очередь изменений (WriteBehind из outbox.py); без нее изменения пишутся в базу напрямую
+        self.writes = writes
+        # Замер запуска сессии (StartupTimer из instrumentation.py) или None
+        self.startup = startup
 
-    def register_command(self, e):
+        # Состояние постраничной загрузки списка
+        self.search_filter = ("", None)
+        self.next_page_key = None
+        self.page_lock = asyncio.Lock()
+        self.search_task = None
+
+    @command
+    @batched
+    async def register_command(self, e):
         """Обрабатывает команду регистрации."""
         login = self.registration_view.login_text.value
         email = self.registration_view.email_text.value
@@ -20,36 +69,180 @@ class BudgetController:
             self.registration_view.show_snackbar("Заполните все поля!")
             return
 
-        if self.model.check_user_exists(login, email):
+        # Занятость логина и email проверяют UNIQUE-индексы при добавлении пользователя
+        try:
+            user_id = await self.model.register_user(login, email, password)
+        except UserExists:
             self.registration_view.show_snackbar("Логин или email уже заняты!")
             return
-
-        if self.model.register_user(login, email, password):
+        if user_id is not None:
+            await self.start_session(user_id)
             self.registration_view.show_snackbar("Регистрация успешна!")
             self.registration_view.clear_fields()
-            self.switch_to_budget(None)  # Переход к основному интерфейсу
+            await self.switch_to_budget(None)  # Переход к основному интерфейсу
         else:
             self.registration_view.show_snackbar("Ошибка регистрации. Попробуйте снова.")
 
-    def switch_to_budget(self, e):
-        """Переключает на интерфейс бюджета."""
+    @command
+    @batched
+    async def login_command(self, e):
+        """Входит по логину (или email) и паролю из формы."""
+        login = self.registration_view.login_text.value or self.registration_view.email_text.value
+        password = self.registration_view.password_text.value
+
+        if not login or not password:
+            self.registration_view.show_snackbar("Введите логин или email и пароль!")
+            return
+
+        user_id = await self.model.authenticate(login, password)
+        if user_id is None:
+            self.registration_view.show_snackbar("Неверный логин или пароль!")
+            return
+        await self.start_session(user_id)
+        self.registration_view.clear_fields()
+        await self.switch_to_budget(None)
+
+    @command
+    @batched
+    async def restore_session_command(self):
+        """Входит по токену, сохраненному в браузере, без проверки пароля.
+
+        Возвращает True, если токен действителен и открыт интерфейс бюджета.
+        """
+        token = await self.current_page.client_storage.get_async(SESSION_KEY)
+        user_id = self.sessions.get(token)
+        if user_id is None:
+            return False
+        self.user_id = user_id
+        self.session_token = token
+        await self.switch_to_budget(None)
+        return True
+
+    @command
+    @batched
+    async def logout_command(self, e):
+        """Завершает сессию и возвращает к форме входа."""
+        if self.session_token:
+            self.sessions.revoke(self.session_token)
+            await self.current_page.client_storage.remove_async(SESSION_KEY)
+        self.user_id = None
+        self.session_token = None
+        self.cancel_search()
+        self.search_filter = ("", None)
+        self.next_page_key = None
+        self.current_page.controls.clear()
+        self.registration_view.setup_ui(self.current_page)
+        request_update(self.current_page)
+
+    async def start_session(self, user_id):
+        """Запоминает вошедшего пользователя и сохраняет токен сессии в браузере."""
+        self.user_id = user_id
+        self.session_token = self.sessions.create(user_id)
         if self.current_page:
+            await self.current_page.client_storage.set_async(SESSION_KEY, self.session_token)
+
+    @command
+    @batched
+    async def switch_to_budget(self, e):
+        """Переключает на интерфейс бюджета вошедшего пользователя.
+
+        Каркас экрана с заглушками отправляется клиенту сразу, а категории
+        и записи загружаются после этого параллельно.
+        """
+        if self.current_page and self.user_id is not None:
             self.current_page.controls.clear()
             self.view.setup_ui(self.current_page)
-            self.current_page.update()
+            request_update(self.current_page)
+            flush_updates()
+            self.mark_startup("first_paint")
+            categories, _ = await asyncio.gather(self.get_categories(), self.update_view())
+            self.view.update_category_dropdown(categories)
+            self.mark_startup("data", finish=True)
+
+    def mark_startup(self, stage, finish=False):
+        """Отмечает этап запуска сессии в self.startup (StartupTimer), если замер включен."""
+        if self.startup:
+            self.startup.mark(stage)
+            if finish:
+                self.startup.finish()
 
-    def get_categories(self):
-        return self.model.get_categories()
+    async def get_categories(self):
+        return await self.model.get_categories()
 
-    def view_command(self, e):
+    async def get_category_id(self, name):
+        """Возвращает id категории по названию из выпадающего списка (None — без категории)."""
+        return await self.model.get_category_id(name)
+
+    @command
+    @batched
+    async def view_command(self, e):
         self.view.category_dropdown.value = "Все категории"
         self.view.product_text.value = ""
-        self.update_view()
+        await self.update_view()
+
+    @command
+    @batched
+    async def search_command(self, e):
+        self.cancel_search()
+        await self.update_view()
+
+    @command
+    @batched
+    async def live_search_command(self, e):
+        """Запускает поиск по мере ввода названия, если включен живой поиск.
+
+        Поиск откладывается на SEARCH_DEBOUNCE секунд после последнего изменения;
+        каждое новое изменение отменяет предыдущий отложенный или уже идущий поиск,
+        так что на экран попадает только результат последнего запроса.
+        """
+        if not self.view.live_search_switch.value:
+            return
+        self.cancel_search()
+        self.search_task = asyncio.create_task(self.debounced_search())
+
+    async def debounced_search(self):
+        await asyncio.sleep(SEARCH_DEBOUNCE)
+        await self.update_view()
 
-    def search_command(self, e):
-        self.update_view()
+    def read_price(self):
+        """Стоимость из поля ввода в Decimal рублей; None и сообщение, если она неверна."""
+        try:
+            price = parse_money(self.view.price_text.value)
+        except ValueError:
+            self.view.show_snackbar("Стоимость должна быть числом, например 1500 или 99,90!")
+            return None
+        if price <= 0:
+            self.view.show_snackbar("Стоимость должна быть больше нуля!")
+            return None
+        return price
 
-    def add_command(self, e):
+    def cancel_search(self):
+        if self.search_task and not self.search_task.done():
+            self.search_task.cancel()
+        self.search_task = None
+
+    async def write(self, operation, *args):
+        """Добавляет, изменяет или удаляет запись вошедшего пользователя.
+
+        С очередью изменений не ждет недоступную базу: изменение откладывается,
+        и пользователь видит сообщение об этом. Возвращает False, если изменение отложено
+        или отклонено базой.
+        """
+        if self.writes is None:
+            await getattr(self.model, operation)(self.user_id, *args)
+            return True
+        try:
+            if await self.writes.submit(operation, self.user_id, *args):
+                return True
+        except OperationRejected as e:
+            self.view.show_snackbar(f"Изменение не сохранено: {e}")
+            return False
+        self.view.show_snackbar("Нет связи с базой: изменение сохранено и будет отправлено позже")
+        return False
+
+    @command
+    @batched
+    async def add_command(self, e):
         if not self.view.product_text.value or not self.view.price_text.value:
             self.view.show_snackbar("Заполните название и стоимость!")
             return
@@ -58,27 +251,119 @@ class BudgetController:
             self.view.show_snackbar("Выберите дату!")
             return
 
-        category_id = next((cat[0] for cat in self.get_categories()
-                            if cat[1] == self.view.category_dropdown.value), None)
+        price = self.read_price()
+        if price is None:
+            return
+
+        category_id = await self.get_category_id(self.view.category_dropdown.value)
+
+        period = self.view.repeat_dropdown.value
+        if period in RECURRING_PERIODS:
+            await self.add_recurring(period, price, category_id)
+        elif await self.write(
+                "insert",
+                self.view.product_text.value,
+                price,
+                self.view.comment_text.value,
+                category_id,
+                self.view.selected_date.strftime("%Y-%m-%d")):
+            await self.warn_budget(category_id, self.view.category_dropdown.value, self.view.selected_date)
+
+        await self.update_view()
+        self.view.clear_fields()
 
-        self.model.insert(
+    @command
+    @batched
+    async def recurring_command(self, e):
+        """Показывает повторяющиеся расходы пользователя."""
+        self.view.show_recurring(await self.model.get_recurring(self.user_id))
+
+    @command
+    @batched
+    async def delete_recurring_command(self, id):
+        """Удаляет правило повторяющегося расхода: новые записи по нему больше не добавляются."""
+        if await self.model.delete_recurring(self.user_id, id):
+            self.view.show_snackbar("Повторяющийся расход удален, добавленные записи сохранены")
+        else:
+            self.view.show_snackbar("Не удалось удалить повторяющийся расход")
+        self.view.show_recurring(await self.model.get_recurring(self.user_id))
+
+    async def warn_budget(self, category_id, category_name, day):
+        """Предупреждает, если расходы категории за месяц даты day превысили ее лимит."""
+        budget = await self.model.check_budget(self.user_id, category_id, day)
+        if budget is None:
+            return
+        limit, spent = budget
+        if spent > limit:
+            name = category_name if category_id else "Без категории"
+            self.view.show_snackbar(f"Превышен лимит «{name}» на месяц: потрачено {spent:.2f} из {limit:.2f} руб.")
+
+    @command
+    @batched
+    async def limit_command(self, e):
+        """Устанавливает месячный лимит выбранной категории из поля «Стоимость»; пустое поле снимает лимит."""
+        name = self.view.category_dropdown.value
+        if not name or name == "Все категории":
+            self.view.show_snackbar("Выберите категорию для лимита!")
+            return
+        category_id = await self.get_category_id(name)
+
+        amount = None
+        if self.view.price_text.value:
+            amount = self.read_price()
+            if amount is None:
+                return
+        if not await self.model.set_budget_limit(self.user_id, category_id, amount):
+            self.view.show_snackbar("Не удалось сохранить лимит")
+        elif amount is None:
+            self.view.show_snackbar(f"Лимит «{name}» снят")
+        else:
+            self.view.show_snackbar(f"Лимит «{name}» на месяц: {amount:.2f} руб.")
+            await self.warn_budget(category_id, name, date.today())
+
+    async def add_recurring(self, period, price, category_id):
+        """Сохраняет запись из полей ввода как повторяющийся расход с выбранной даты.
+
+        Повторения с датой не позже сегодняшней добавляются сразу, остальные —
+        планировщиком (RecurringScheduler) по мере наступления.
+        """
+        rule_id = await self.model.add_recurring(
+            self.user_id,
             self.view.product_text.value,
-            self.view.price_text.value,
+            price,
             self.view.comment_text.value,
             category_id,
+            period,
             self.view.selected_date.strftime("%Y-%m-%d")
         )
+        if rule_id is None:
+            self.view.show_snackbar("Не удалось сохранить повторяющийся расход")
+            return
+        try:
+            count = await self.model.materialize_recurring(date.today(), [rule_id])
+        except Error as e:
+            print(f"Ошибка добавления повторяющихся расходов: {e}")
+            count = 0
+        self.view.show_snackbar(f"Повторяющийся расход сохранен, добавлено записей: {count}")
 
-        self.update_view()
-        self.view.clear_fields()
-
-    def delete_command(self, e):
+    @command
+    @batched
+    async def delete_command(self, e):
+        """Удаляет отмеченные флажками записи одной транзакцией, а если их нет — выбранную запись."""
+        if self.view.selected_ids:
+            count = await self.model.delete_many(self.user_id, sorted(self.view.selected_ids))
+            self.view.clear_selection()
+            await self.update_view()
+            self.view.show_snackbar(f"Удалено записей: {count}")
+            return
         if self.view.selected_tuple:
-            self.model.delete(self.view.selected_tuple[0])
-            self.update_view()
+            await self.write("delete", self.view.selected_tuple[0])
+            await self.update_view()
             self.view.clear_fields()
 
-    def update_command(self, e):
+    @command
+    @batched
+    async def update_command(self, e):
         if not self.view.selected_tuple:
             self.view.show_snackbar("Выберите запись для обновления!")
             return
@@ -91,36 +376,104 @@ class BudgetController:
             self.view.show_snackbar("Выберите дату!")
             return
 
-        category_id = next((cat[0] for cat in self.get_categories()
-                            if cat[1] == self.view.category_dropdown.value), None)
+        price = self.read_price()
+        if price is None:
+            return
 
-        self.model.update(
-            self.view.selected_tuple[0],
-            self.view.product_text.value,
-            self.view.price_text.value,
-            self.view.comment_text.value,
-            category_id,
-            self.view.selected_date.strftime("%Y-%m-%d")
-        )
+        category_id = await self.get_category_id(self.view.category_dropdown.value)
+
+        if await self.write(
+                "update",
+                self.view.selected_tuple[0],
+                self.view.product_text.value,
+                price,
+                self.view.comment_text.value,
+                category_id,
+                self.view.selected_date.strftime("%Y-%m-%d")):
+            await self.warn_budget(category_id, self.view.category_dropdown.value, self.view.selected_date)
+
+        await self.update_view()
+
+    @command
+    @batched
+    async def recategorize_command(self, e):
+        """Переносит отмеченные записи в категорию из выпадающего списка одной транзакцией."""
+        if not self.view.selected_ids:
+            self.view.show_snackbar("Отметьте записи флажками!")
+            return
+
+        name = self.view.category_dropdown.value
+        if not name or name == "Все категории":
+            self.view.show_snackbar("Выберите категорию для отмеченных записей!")
+            return
+        category_id = await self.get_category_id(name)
 
-        self.update_view()
+        count = await self.model.recategorize_many(self.user_id, sorted(self.view.selected_ids), category_id)
+        self.view.clear_selection()
+        await self.update_view()
+        self.view.show_snackbar(f"Категория изменена у записей: {count}")
 
     def select_row(self, row):
         self.view.select_row(row)
 
-    def update_view(self):
-        selected_category = (self.view.category_dropdown.value
-                             if self.view.category_dropdown.value and
-                                self.view.category_dropdown.value != "Все категории"
-                             else "")
+    @command
+    @batched
+    async def export_command(self, path):
+        """Выгружает все записи в файл: .buycol — колоночный формат, иначе CSV."""
+        fmt = "columnar" if path.endswith(".buycol") else "csv"
+        try:
+            count = await self.model.run(export_file, self.model.db, self.user_id, path, fmt)
+        except (*Error, OSError) as e:
+            self.view.show_snackbar(f"Ошибка выгрузки: {e}")
+            return
+        self.view.show_snackbar(f"Выгружено записей: {count}")
 
-        rows = self.model.search(
-            product=self.view.product_text.value if self.view.product_text.value else "",
-            category=selected_category
-        )
+    @command
+    @batched
+    async def analytics_command(self, e):
+        """Показывает расходы по категориям за последние периоды выбранной длины."""
+        report = await self.model.run(spend_report, self.model.db, self.user_id, self.view.analytics.period)
+        self.view.show_analytics(report)
 
-        self.view.update_list(rows)
+    @command
+    @batched
+    async def load_more_command(self, e):
+        """Догружает следующую страницу списка при прокрутке к концу."""
+        if self.next_page_key is None or self.page_lock.locked():
+            return
+        async with self.page_lock:
+            product, category_id = self.search_filter
+            rows = await self.model.search(self.user_id, product, category_id,
+                                           after=self.next_page_key, limit=PAGE_SIZE)
+            self.set_next_page_key(rows)
+            if rows:
+                self.view.append_list(rows)
 
-        total = self.model.get_total_spent()
-        top_category, top_amount = self.model.get_top_category()
+    def set_next_page_key(self, rows):
+        self.next_page_key = self.model.page_key(rows[-1]) if len(rows) == PAGE_SIZE else None
+
+    @command
+    @batched
+    async def update_view(self):
+        category_id = (await self.get_category_id(self.view.category_dropdown.value)
+                       if self.view.category_dropdown.value and
+                          self.view.category_dropdown.value != "Все категории"
+                       else None)
+        product = self.view.product_text.value if self.view.product_text.value else ""
+
+        async with self.page_lock:
+            self.view.set_loading(True)
+            try:
+                rows, total, top_category, top_amount = await self.model.get_dashboard(
+                    self.user_id,
+                    product=product,
+                    category_id=category_id,
+                    limit=PAGE_SIZE
+                )
+            finally:
+                self.view.set_loading(False)
+            self.search_filter = (product, category_id)
+            self.set_next_page_key(rows)
+
+        self.view.update_list(rows)
         self.view.update_stats(total, top_category, top_amount)
\ No newline at end of file
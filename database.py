@@ -1,159 +1,1220 @@
-import mysql.connector
-from mysql.connector import Error
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from itertools import islice
+from queue import LifoQueue, Empty
+
+from backends import Error, IntegrityError, PoolError, backend_from_url, is_unavailable
+from instrumentation import InstrumentedCursor, QueryLog
+from money import ZERO, from_kopecks, to_kopecks
+from passwords import PasswordHasher
+
+# Ключ сводной таблицы buy_summary. id_user = 0 и category_id = 0 соответствуют
+# записям без владельца и без категории; month — первое число месяца.
+# Суммы в buy.price и buy_summary.total хранятся в копейках (см. money.py).
+SUMMARY_KEY = ("id_user", "category_id", "month")
+
+# Размер страницы списка покупок по умолчанию.
+PAGE_SIZE = 50
+
+# Хэши паролей начинаются с "scrypt$"; остальные значения users.password — открытый текст.
+PASSWORD_HASH_PATTERN = "scrypt$%"
+
+# Сколько секунд кэшированный результат get_dashboard считается актуальным.
+SEARCH_CACHE_TTL = 5.0
+
+# Сколько id подставляется в один запрос вида id IN (...).
+ID_BATCH_SIZE = 500
+
+# Изменения, которые можно отложить в локальную очередь (см. outbox.py и DB.apply_operations).
+QUEUED_OPERATIONS = ("insert", "update", "delete")
+
+# Периоды повторяющихся расходов (таблица recurring).
+RECURRING_PERIODS = ("day", "week", "month")
+
+
+def chunks(values, size):
+    """Делит последовательность на списки не длиннее size."""
+    values = list(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def with_money(rows, index=2):
+    """Заменяет стоимость в копейках в колонке index строк на Decimal рублей."""
+    return [row[:index] + (from_kopecks(row[index]),) + row[index + 1:] for row in rows]
+
+
+def month_start(value):
+    """Первое число месяца для даты, даты со временем или строки YYYY-MM-DD."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def next_month(month):
+    """Первое число следующего месяца."""
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def next_occurrence(day, period, anchor_day):
+    """Дата следующего повторения расхода после day.
+
+    Для месяцев берется число anchor_day (число start_date правила), а в коротких
+    месяцах — их последний день: 31.01 -> 28.02 -> 31.03.
+    """
+    if period == "day":
+        return day + timedelta(days=1)
+    if period == "week":
+        return day + timedelta(days=7)
+    if period == "month":
+        month = next_month(day.replace(day=1))
+        return month.replace(day=min(anchor_day, monthrange(month.year, month.month)[1]))
+    raise ValueError(f"Неизвестный период: {period}")
+
+
+def is_alive(connection):
+    """Проверяет, что подключение живо (один запрос к серверу)."""
+    try:
+        if hasattr(connection, "is_connected"):
+            return connection.is_connected()
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    """Пул подключений с выдачей на поток.
+
+    Подключения создаются фабрикой connect по мере необходимости, но не больше size.
+    Проверка подключения выполняется при выдаче из пула, и только если оно простаивало
+    дольше ping_interval секунд или было возвращено после ошибки. Повторный acquire()
+    в том же потоке возвращает уже выданное подключение, поэтому вложенные вызовы
+    методов DB не занимают лишних подключений.
+    """
+
+    def __init__(self, connect, size=5, timeout=10.0, ping_interval=30.0, health_check=is_alive):
+        if size < 1:
+            raise ValueError("Размер пула должен быть не меньше 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.health_check = health_check
+        self._idle = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def acquire(self):
+        """Выдает подключение текущему потоку."""
+        held = getattr(self._local, "connection", None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+        connection = self._checkout()
+        self._local.connection = connection
+        self._local.depth = 1
+        self._local.healthy = True
+        return connection
+
+    def release(self, connection, healthy=True):
+        """Возвращает подключение; при healthy=False оно будет проверено перед следующей выдачей."""
+        if getattr(self._local, "connection", None) is not connection:
+            raise PoolError("Подключение не было выдано этому потоку")
+        self._local.healthy = self._local.healthy and healthy
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        self._local.connection = None
+        self._idle.put((connection, time.monotonic() if self._local.healthy else 0.0))
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        healthy = True
+        try:
+            yield connection
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.release(connection, healthy)
+
+    def close(self):
+        """Закрывает все простаивающие подключения."""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            self._discard(connection)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except Empty:
+                connection = self._create()
+                if connection is not None:
+                    return connection
+                remaining = deadline - time.monotonic()
+                try:
+                    connection, last_used = self._idle.get(timeout=max(remaining, 0))
+                except Empty:
+                    raise PoolError(f"Все {self.size} подключений пула заняты") from None
+
+            if time.monotonic() - last_used < self.ping_interval or self.health_check(connection):
+                return connection
+            self._discard(connection)
+
+    def _create(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class CategoryCache:
+    """Кэш справочника категорий с индексами по названию и по id.
+
+    Справочник загружается функцией load при первом обращении и после invalidate().
+    Если задан ttl (в секундах), по его истечении справочник загружается заново.
+    """
+
+    def __init__(self, load, ttl=None):
+        self.load = load
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = None
+        self._by_name = {}
+        self._by_id = {}
+        self._loaded_at = 0.0
+
+    def rows(self):
+        """Возвращает список (id, name) всех категорий."""
+        return self._current()[0]
+
+    def id_by_name(self, name):
+        return self._current()[1].get(name)
+
+    def name_by_id(self, id):
+        return self._current()[2].get(id)
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    def _current(self):
+        with self._lock:
+            expired = self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+            if self._rows is None or expired:
+                rows = list(self.load())
+                self._rows = rows
+                self._by_name = {name: id for id, name in rows}
+                self._by_id = {id: name for id, name in rows}
+                self._loaded_at = time.monotonic()
+            return self._rows, self._by_name, self._by_id
+
+
+class SearchCache:
+    """LRU-кэш результатов get_dashboard по ключу (user_id, строка поиска, категория, размер страницы).
+
+    Изменение записей пользователя через этот DB сбрасывает его записи в кэше
+    и увеличивает номер поколения; результат запроса, начатого до изменения,
+    в кэш не попадает. Изменения из других процессов (manage.py, другие экземпляры
+    приложения) здесь не видны, поэтому записи живут не дольше ttl секунд.
+    """
+
+    def __init__(self, size=256, ttl=SEARCH_CACHE_TTL, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # ключ -> (результат, срок действия)
+        self._generations = {}
+        self._cleared = 0  # номер очистки clear() — общее поколение всех пользователей
+        self._lock = threading.Lock()
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._cleared, self._generations.get(user_id, 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if (self._cleared, self._generations.get(key[0], 0)) != generation:
+                return
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """Сбрасывает записи всех пользователей; результаты начатых запросов в кэш не попадут."""
+        with self._lock:
+            self._cleared += 1
+            self._entries.clear()
+
+
+class UserExists(Exception):
+    """Пользователь с таким логином или email уже зарегистрирован."""
+
+
+class DatabaseUnavailable(Exception):
+    """Нет подключения к базе данных или оно оборвалось."""
+
 
 class DB:
-    def __init__(self):
-        self.connection = None
-        self.connect()
-
-    def connect(self):
-        try:
-            self.connection = mysql.connector.connect(
-                host="localhost",
-                user="root",  # Замените на ваше имя пользователя MySQL
-                password="password",  # Замените на ваш пароль MySQL
-                database="app"
-            )
-            if self.connection.is_connected():
-                print("Подключено к базе данных MySQL")
-        except Error as e:
-            print(f"Ошибка подключения к MySQL: {e}")
-            self.connection = None
-
-    def get_cursor(self):
-        if not self.connection or not self.connection.is_connected():
-            self.connect()
-            if not self.connection or not self.connection.is_connected():
-                raise Exception("Не удалось установить подключение к базе данных")
-        return self.connection.cursor()
+    """Доступ к данным приложения.
+
+    backend — хранилище (MySQLBackend или SQLiteBackend из backends.py); по умолчанию
+    выбирается по DATABASE_URL. Запросы ко всем записям buy ограничены одним
+    пользователем (индекс по id_user, date); user_id=None — записи без владельца.
+    Время и число строк каждого запроса учитываются в query_log (QueryLog из
+    instrumentation.py); query_log=False отключает замеры. passwords — PasswordHasher
+    с параметрами стоимости хэширования паролей.
+
+    Подключения открываются при первом запросе, поэтому создание DB не ждет базу
+    и не задерживает первую отрисовку интерфейса.
+    """
+
+    def __init__(self, backend=None, pool_size=5, category_ttl=None, search_cache_size=256, query_log=None,
+                 passwords=None, search_cache_ttl=SEARCH_CACHE_TTL):
+        self.backend = backend or backend_from_url()
+        self.query_log = QueryLog() if query_log is None else query_log
+        self.passwords = passwords or PasswordHasher()
+        self._dummy = None
+        self.pool = ConnectionPool(self.backend.connect, size=min(pool_size, self.backend.max_connections or pool_size))
+        self.categories = CategoryCache(self._load_categories, ttl=category_ttl)
+        self.search_cache = SearchCache(search_cache_size, search_cache_ttl)
+        self._local = threading.local()
+
+    def _cursor(self, connection, operation):
+        cursor = self.backend.cursor(connection)
+        if not self.query_log:
+            return cursor
+        return InstrumentedCursor(cursor, connection, self.backend, self.query_log, operation)
+
+    @contextmanager
+    def cursor(self, operation=None):
+        """Выдает курсор на подключении текущего потока; operation — метка запросов в query_log."""
+        with self.pool.connection() as connection:
+            cursor = self._cursor(connection, operation)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self, operation=None):
+        """Выполняет блок в одной транзакции; вложенные вызовы присоединяются к внешней."""
+        with self.pool.connection() as connection:
+            depth = getattr(self._local, "depth", 0)
+            if not depth:
+                self.backend.begin(connection)
+            self._local.depth = depth + 1
+            cursor = self._cursor(connection, operation)
+            try:
+                yield cursor
+                if not depth:
+                    connection.commit()
+            except Exception:
+                if not depth:
+                    connection.rollback()
+                raise
+            finally:
+                self._local.depth = depth
+                cursor.close()
 
     def check_user_exists(self, login, email):
-        """Проверяет, существует ли пользователь с указанным логином или email."""
+        """Проверяет, существует ли пользователь с указанным логином или email (по UNIQUE-индексам)."""
         try:
-            cursor = self.get_cursor()
-            query = "SELECT id FROM users WHERE login = %s OR email = %s"
-            cursor.execute(query, (login, email))
-            result = cursor.fetchone()
-            cursor.close()
-            return result is not None
+            with self.cursor("check_user_exists") as cursor:
+                query = """
+                    SELECT id FROM users WHERE login = %s
+                    UNION ALL
+                    SELECT id FROM users WHERE email = %s
+                    LIMIT 1
+                """
+                cursor.execute(query, (login, email))
+                return cursor.fetchone() is not None
         except Error as e:
             print(f"Ошибка проверки пользователя: {e}")
             return False
 
     def register_user(self, login, email, password):
-        """Регистрирует нового пользователя."""
+        """Регистрирует нового пользователя и возвращает его id (None при ошибке).
+
+        Пароль сохраняется хэшем (см. passwords.py). Если логин или email уже заняты,
+        вызывает UserExists: уникальность проверяют индексы таблицы users.
+        """
+        password_hash = self.passwords.hash(password)
         try:
-            cursor = self.get_cursor()
-            query = "INSERT INTO users (login, email, password) VALUES (%s, %s, %s)"
-            cursor.execute(query, (login, email, password))
-            self.connection.commit()
-            cursor.close()
-            return True
+            with self.transaction("register_user") as cursor:
+                query = "INSERT INTO users (login, email, password) VALUES (%s, %s, %s)"
+                cursor.execute(query, (login, email, password_hash))
+                return cursor.lastrowid
+        except IntegrityError:
+            raise UserExists(login, email) from None
         except Error as e:
             print(f"Ошибка регистрации пользователя: {e}")
-            return False
+            return None
 
-    def get_categories(self):
+    def authenticate(self, login, password):
+        """Возвращает id пользователя с логином или email login, если пароль верен, иначе None.
+
+        Пароли, сохраненные без хэша или с устаревшими параметрами, перехэшируются.
+        """
+        try:
+            with self.cursor("authenticate") as cursor:
+                query = """
+                    SELECT id, password FROM users WHERE login = %s
+                    UNION ALL
+                    SELECT id, password FROM users WHERE email = %s
+                    LIMIT 1
+                """
+                cursor.execute(query, (login, login))
+                row = cursor.fetchone()
+        except Error as e:
+            print(f"Ошибка входа пользователя: {e}")
+            return None
+
+        if row is None:
+            # Время ответа не должно выдавать, существует ли логин
+            self.passwords.verify(password, self._dummy_hash())
+            return None
+        user_id, stored = row
+        if not self.passwords.verify(password, stored):
+            return None
+        if self.passwords.needs_rehash(stored):
+            self._set_password_hash(user_id, self.passwords.hash(password))
+        return user_id
+
+    def _dummy_hash(self):
+        if self._dummy is None:
+            self._dummy = self.passwords.hash("")
+        return self._dummy
+
+    def _set_password_hash(self, user_id, password_hash):
         try:
-            cursor = self.get_cursor()
+            with self.transaction("authenticate") as cursor:
+                cursor.execute("UPDATE users SET password = %s WHERE id = %s", (password_hash, user_id))
+        except Error as e:
+            print(f"Ошибка обновления пароля: {e}")
+
+    def hash_stored_passwords(self):
+        """Заменяет хэшами пароли, сохраненные открытым текстом. Возвращает число измененных."""
+        with self.cursor("hash_stored_passwords") as cursor:
+            cursor.execute("SELECT id, password FROM users WHERE password NOT LIKE %s", (PASSWORD_HASH_PATTERN,))
+            plain = cursor.fetchall()
+        for user_id, password in plain:
+            self._set_password_hash(user_id, self.passwords.hash(password or ""))
+        return len(plain)
+
+    def _load_categories(self):
+        with self.cursor("get_categories") as cursor:
             cursor.execute("SELECT id, name FROM categories")
-            categories = cursor.fetchall()
-            cursor.close()
-            return categories
+            return cursor.fetchall()
+
+    def get_categories(self):
+        try:
+            return self.categories.rows()
         except Error as e:
             print(f"Ошибка получения категорий: {e}")
             return []
 
-    def search(self, product="", category=""):
+    def get_category_id(self, name):
+        """Возвращает id категории по названию или None, если такой категории нет."""
         try:
-            cursor = self.get_cursor()
-            query = """
-                SELECT b.id, b.product, b.price, b.comment, c.name, b.date
-                FROM buy b
-                LEFT JOIN categories c ON b.category_id = c.id
-                WHERE b.product LIKE %s
-            """
-            params = (f"%{product}%",)
-            if category:
-                query += " AND c.name = %s"
-                params = (f"%{product}%", category)
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            cursor.close()
-            return rows
+            return self.categories.id_by_name(name)
+        except Error as e:
+            print(f"Ошибка получения категорий: {e}")
+            return None
+
+    def invalidate_categories(self):
+        """Сбрасывает кэш категорий; вызывается после изменения таблицы categories."""
+        self.categories.invalidate()
+
+    def _search_filter(self, user_id, product="", category_id=None, after=None):
+        """Собирает условие WHERE и параметры фильтра записей пользователя.
+
+        product ищется полнотекстовым индексом бэкенда по названию и комментарию;
+        каждое слово обязательно и ищется по префиксу.
+        after — ключ (date, id) последней полученной записи: выбираются записи
+        строго после нее в порядке ORDER BY b.date DESC, b.id DESC.
+        """
+        where = self.backend.same("b.id_user")
+        params = (user_id,)
+        terms = self.backend.search_terms(product)
+        if terms:
+            where += f" AND {self.backend.text_match()}"
+            params += (terms,)
+        if category_id is not None:
+            where += " AND b.category_id = %s"
+            params += (category_id,)
+        if after:
+            after_date, after_id = after
+            if after_date is None:
+                where += " AND b.date IS NULL AND b.id < %s"
+                params += (after_id,)
+            else:
+                where += " AND (b.date < %s OR (b.date = %s AND b.id < %s) OR b.date IS NULL)"
+                params += (after_date, after_date, after_id)
+        return where, params
+
+    def search(self, user_id, product="", category_id=None, after=None, limit=None):
+        """Ищет записи пользователя, от новых к старым.
+
+        С limit возвращает одну страницу; следующая страница запрашивается
+        с after=(date, id) последней записи (см. page_key()).
+        """
+        try:
+            with self.cursor("search") as cursor:
+                where, params = self._search_filter(user_id, product, category_id, after)
+                query = f"""
+                    SELECT b.id, b.product, b.price, b.comment, c.name, b.date
+                    FROM buy b
+                    LEFT JOIN categories c ON b.category_id = c.id
+                    WHERE {where}
+                    ORDER BY b.date DESC, b.id DESC
+                """
+                if limit:
+                    query += " LIMIT %s"
+                    params += (limit,)
+                cursor.execute(query, params)
+                return with_money(cursor.fetchall())
         except Error as e:
             print(f"Ошибка поиска записей: {e}")
             return []
 
-    def insert(self, product, price, comment, category_id, date):
+    @staticmethod
+    def page_key(row):
+        """Ключ (date, id) записи для запроса следующей страницы search()."""
+        return row[5], row[0]
+
+    def get_dashboard(self, user_id, product="", category_id=None, limit=PAGE_SIZE):
+        """Возвращает первую страницу записей и статистику для экрана бюджета одним запросом.
+
+        Результат — (rows, total, top_category, top_amount): то же, что search(),
+        get_total_spent() и get_top_category(), но за один обход сервера.
+        Статистика повторяется в каждой строке результата, а при пустой выборке
+        возвращается одна строка без записи. Результаты кэшируются в search_cache
+        до следующего изменения записей пользователя, но не дольше SEARCH_CACHE_TTL секунд.
+        """
+        key = (user_id, self.backend.search_terms(product), category_id, limit)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        generation = self.search_cache.generation(user_id)
+        try:
+            with self.cursor("get_dashboard") as cursor:
+                where, params = self._search_filter(user_id, product, category_id)
+                query = f"""
+                    SELECT r.id, r.product, r.price, r.comment, r.category, r.date,
+                           s.total, s.name, s.amount
+                    FROM (SELECT 1 AS one) d
+                    LEFT JOIN (
+                        SELECT g.name, g.amount, SUM(g.amount) OVER () AS total
+                        FROM (
+                            SELECT c.name, SUM(s.total) AS amount
+                            FROM buy_summary s
+                            LEFT JOIN categories c ON s.category_id = c.id
+                            WHERE s.id_user = %s
+                            GROUP BY c.name
+                        ) g
+                        ORDER BY g.amount DESC, g.name
+                        LIMIT 1
+                    ) s ON TRUE
+                    LEFT JOIN (
+                        SELECT b.id, b.product, b.price, b.comment, c.name AS category, b.date
+                        FROM buy b
+                        LEFT JOIN categories c ON b.category_id = c.id
+                        WHERE {where}
+                        ORDER BY b.date DESC, b.id DESC
+                        LIMIT %s
+                    ) r ON TRUE
+                    ORDER BY r.date DESC, r.id DESC
+                """
+                cursor.execute(query, (user_id or 0,) + params + (limit,))
+                result = cursor.fetchall()
+        except Error as e:
+            print(f"Ошибка получения данных экрана: {e}")
+            return [], ZERO, "Нет данных", ZERO
+
+        rows = with_money([row[:6] for row in result if row[0] is not None])
+        total, top_category, top_amount = result[0][6:] if result else (None, None, None)
+        dashboard = rows, from_kopecks(total), top_category or "Нет данных", from_kopecks(top_amount)
+        self.search_cache.put(key, dashboard, generation)
+        return dashboard
+
+    def iter_export(self, user_id, batch_size=1000):
+        """Потоково выдает все записи пользователя (id, date, product, price, category, comment) в порядке id.
+
+        price — Decimal рублей.
+
+        Строки читаются небуферизованным курсором порциями по batch_size, поэтому
+        вся история в памяти не держится. Пока генератор не исчерпан, подключение
+        текущего потока занято выгрузкой: другие методы DB в этом потоке не вызывайте.
+        """
+        with self.cursor("iter_export") as cursor:
+            cursor.execute(f"""
+                SELECT b.id, b.date, b.product, b.price, c.name, b.comment
+                FROM buy b
+                LEFT JOIN categories c ON b.category_id = c.id
+                WHERE {self.backend.same("b.id_user")}
+                ORDER BY b.id
+            """, (user_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from with_money(rows, 3)
+
+    def _apply_summary(self, cursor, ids, sign):
+        """Добавляет (sign=1) или вычитает (sign=-1) записи buy с указанными id из сводной таблицы.
+
+        Сумма берется из самих строк buy, поэтому сводка совпадает с тем,
+        что хранится в таблице, независимо от округления при записи.
+        Строки сводки, в которых не осталось записей, удаляются, чтобы в статистике
+        не появлялись категории с нулевой суммой.
+        """
+        b = self.backend
+        for chunk in chunks(ids, ID_BATCH_SIZE):
+            cursor.execute(f"""
+                INSERT INTO buy_summary (id_user, category_id, month, total, entries)
+                SELECT COALESCE(id_user, 0), COALESCE(category_id, 0), {b.month_start("date")},
+                       %s * SUM(price), %s * COUNT(*)
+                FROM buy
+                WHERE id IN ({placeholders(chunk)})
+                GROUP BY 1, 2, 3
+                {b.on_conflict(SUMMARY_KEY)}
+                    total = total + {b.excluded("total")},
+                    entries = entries + {b.excluded("entries")}
+            """, (sign, sign, *chunk))
+            if sign < 0:
+                cursor.execute(f"""
+                    DELETE FROM buy_summary
+                    WHERE entries = 0 AND ({", ".join(SUMMARY_KEY)}) IN (
+                        SELECT COALESCE(id_user, 0), COALESCE(category_id, 0), {b.month_start("date")}
+                        FROM buy
+                        WHERE id IN ({placeholders(chunk)})
+                    )
+                """, chunk)
+
+    def _owns(self, cursor, user_id, id):
+        """Блокирует запись id до конца транзакции и проверяет, что она принадлежит пользователю."""
+        return bool(self._owned_ids(cursor, user_id, (id,)))
+
+    def _owned_ids(self, cursor, user_id, ids):
+        """Блокирует записи до конца транзакции и возвращает те из ids, что принадлежат пользователю."""
+        owned = []
+        for chunk in chunks(ids, ID_BATCH_SIZE):
+            cursor.execute(f"""
+                SELECT b.id FROM buy b
+                WHERE b.id IN ({placeholders(chunk)}) AND {self.backend.same("b.id_user")}
+                ORDER BY b.id{self.backend.for_update}
+            """, (*chunk, user_id))
+            owned.extend(row[0] for row in cursor.fetchall())
+        return owned
+
+    def _insert(self, cursor, user_id, product, price, comment, category_id, date):
+        query = """
+            INSERT INTO buy (id_user, product, price, comment, category_id, date)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        cursor.execute(query, (user_id, product, to_kopecks(price), comment, category_id, date))
+        id = cursor.lastrowid
+        self._apply_summary(cursor, (id,), 1)
+        return id
+
+    def _update(self, cursor, user_id, id, product, price, comment, category_id, date):
+        if not self._owns(cursor, user_id, id):
+            return False
+        query = """
+            UPDATE buy
+            SET product = %s, price = %s, comment = %s, category_id = %s, date = %s
+            WHERE id = %s
+        """
+        self._apply_summary(cursor, (id,), -1)
+        cursor.execute(query, (product, to_kopecks(price), comment, category_id, date, id))
+        self._apply_summary(cursor, (id,), 1)
+        return True
+
+    def _delete(self, cursor, user_id, id):
+        if not self._owns(cursor, user_id, id):
+            return False
+        self._apply_summary(cursor, (id,), -1)
+        cursor.execute("DELETE FROM buy WHERE id = %s", (id,))
+        return True
+
+    def insert(self, user_id, product, price, comment, category_id, date):
+        """Добавляет запись и возвращает ее id (None при ошибке)."""
         try:
-            cursor = self.get_cursor()
-            query = """
-                INSERT INTO buy (product, price, comment, category_id, date)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(query, (product, float(price), comment, category_id, date))
-            self.connection.commit()
-            cursor.close()
+            with self.transaction("insert") as cursor:
+                id = self._insert(cursor, user_id, product, price, comment, category_id, date)
+            self.search_cache.invalidate_user(user_id)
+            return id
         except Error as e:
             print(f"Ошибка добавления записи: {e}")
+            return None
 
-    def update(self, id, product, price, comment, category_id, date):
+    def update(self, user_id, id, product, price, comment, category_id, date):
+        """Изменяет запись пользователя; price — сумма в рублях (Decimal, строка или число)."""
         try:
-            cursor = self.get_cursor()
-            query = """
-                UPDATE buy
-                SET product = %s, price = %s, comment = %s, category_id = %s, date = %s
-                WHERE id = %s
-            """
-            cursor.execute(query, (product, float(price), comment, category_id, date, id))
-            self.connection.commit()
-            cursor.close()
+            with self.transaction("update") as cursor:
+                if not self._update(cursor, user_id, id, product, price, comment, category_id, date):
+                    return
+            self.search_cache.invalidate_user(user_id)
         except Error as e:
             print(f"Ошибка обновления записи: {e}")
 
-    def delete(self, id):
+    def delete(self, user_id, id):
         try:
-            cursor = self.get_cursor()
-            cursor.execute("DELETE FROM buy WHERE id = %s", (id,))
-            self.connection.commit()
-            cursor.close()
+            with self.transaction("delete") as cursor:
+                if not self._delete(cursor, user_id, id):
+                    return
+            self.search_cache.invalidate_user(user_id)
         except Error as e:
             print(f"Ошибка удаления записи: {e}")
 
-    def get_total_spent(self):
+    def apply_operations(self, operations):
+        """Применяет изменения из локальной очереди (outbox.py) одной транзакцией.
+
+        operations — кортежи (ключ, операция, user_id, аргументы), где операция —
+        одна из QUEUED_OPERATIONS, а аргументы те же, что у одноименного метода
+        после user_id. Ключи записываются в applied_operations в той же транзакции,
+        поэтому изменение, которое уже было применено (например, связь оборвалась
+        до удаления его из очереди), пропускается. Возвращает число примененных изменений.
+
+        Ошибки не перехватываются: если база недоступна, выбрасывается
+        DatabaseUnavailable, иначе — исходная ошибка базы; транзакция откатывается целиком.
+        """
         try:
-            cursor = self.get_cursor()
-            cursor.execute("SELECT SUM(price) FROM buy")
-            total = cursor.fetchone()[0] or 0.0
-            cursor.close()
-            return float(total)
+            with self.transaction("apply_operations") as cursor:
+                keys = [key for key, _, _, _ in operations]
+                done = set()
+                for chunk in chunks(keys, ID_BATCH_SIZE):
+                    cursor.execute(f"SELECT op_key FROM applied_operations WHERE op_key IN ({placeholders(chunk)})",
+                                   chunk)
+                    done.update(row[0] for row in cursor.fetchall())
+                applied = []
+                users = set()
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for key, operation, user_id, args in operations:
+                    if key in done:
+                        continue
+                    if operation not in QUEUED_OPERATIONS:
+                        raise ValueError(f"Неизвестная операция: {operation}")
+                    getattr(self, "_" + operation)(cursor, user_id, *args)
+                    done.add(key)
+                    applied.append((key, now))
+                    users.add(user_id)
+                if applied:
+                    cursor.executemany("INSERT INTO applied_operations (op_key, applied_at) VALUES (%s, %s)", applied)
         except Error as e:
-            print(f"Ошибка подсчета общей суммы: {e}")
-            return 0.0
+            if is_unavailable(e):
+                raise DatabaseUnavailable(str(e)) from e
+            raise
+        for user_id in users:
+            self.search_cache.invalidate_user(user_id)
+        return len(applied)
+
+    def purge_applied_operations(self, days=30):
+        """Удаляет ключи изменений, примененных больше days дней назад; возвращает их число."""
+        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.transaction("purge_applied_operations") as cursor:
+            cursor.execute("DELETE FROM applied_operations WHERE applied_at < %s", (cutoff,))
+            return cursor.rowcount
+
+    def delete_many(self, user_id, ids):
+        """Удаляет записи пользователя с указанными id в одной транзакции.
 
-    def get_top_category(self):
+        Чужие и несуществующие id пропускаются. Возвращает число удаленных записей
+        (0 при ошибке — тогда не удаляется ничего).
+        """
         try:
-            cursor = self.get_cursor()
-            query = """
-                SELECT c.name, SUM(b.price)
+            with self.transaction("delete_many") as cursor:
+                owned = self._owned_ids(cursor, user_id, ids)
+                self._apply_summary(cursor, owned, -1)
+                for chunk in chunks(owned, ID_BATCH_SIZE):
+                    cursor.execute(f"DELETE FROM buy WHERE id IN ({placeholders(chunk)})", chunk)
+            self.search_cache.invalidate_user(user_id)
+            return len(owned)
+        except Error as e:
+            print(f"Ошибка удаления записей: {e}")
+            return 0
+
+    def recategorize_many(self, user_id, ids, category_id):
+        """Переносит записи пользователя в категорию category_id (None — без категории) одной транзакцией.
+
+        Возвращает число измененных записей (0 при ошибке).
+        """
+        try:
+            with self.transaction("recategorize_many") as cursor:
+                owned = self._owned_ids(cursor, user_id, ids)
+                self._apply_summary(cursor, owned, -1)
+                for chunk in chunks(owned, ID_BATCH_SIZE):
+                    cursor.execute(f"UPDATE buy SET category_id = %s WHERE id IN ({placeholders(chunk)})",
+                                   (category_id, *chunk))
+                self._apply_summary(cursor, owned, 1)
+            self.search_cache.invalidate_user(user_id)
+            return len(owned)
+        except Error as e:
+            print(f"Ошибка смены категории: {e}")
+            return 0
+
+    def update_many(self, user_id, rows):
+        """Изменяет несколько записей пользователя одной транзакцией через executemany.
+
+        rows — кортежи (id, product, price, comment, category_id, date), как у update().
+        Записи других пользователей пропускаются. Возвращает число измененных записей
+        (0 при ошибке).
+        """
+        rows = {row[0]: row for row in rows}
+        try:
+            with self.transaction("update_many") as cursor:
+                owned = self._owned_ids(cursor, user_id, rows)
+                self._apply_summary(cursor, owned, -1)
+                cursor.executemany("""
+                    UPDATE buy
+                    SET product = %s, price = %s, comment = %s, category_id = %s, date = %s
+                    WHERE id = %s
+                """, [(product, to_kopecks(price), comment, category_id, date, id)
+                      for id, product, price, comment, category_id, date in map(rows.get, owned)])
+                self._apply_summary(cursor, owned, 1)
+            self.search_cache.invalidate_user(user_id)
+            return len(owned)
+        except Error as e:
+            print(f"Ошибка обновления записей: {e}")
+            return 0
+
+    def insert_many(self, user_id, rows, batch_size=1000, progress=None):
+        """Добавляет записи пачками через executemany в одной транзакции.
+
+        rows — поток кортежей (product, price, comment, category_id, date) со стоимостью
+        в рублях (Decimal, строка или число) и датой в формате YYYY-MM-DD; он читается по batch_size записей и не
+        материализуется целиком. После каждой пачки вызывается progress(inserted).
+        Сводка buy_summary пересчитывается один раз для затронутых месяцев.
+        Ошибки базы данных не перехватываются: транзакция откатывается целиком.
+        Возвращает число добавленных записей.
+        """
+        query = """
+            INSERT INTO buy (id_user, product, price, comment, category_id, date)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        inserted = 0
+        months = set()
+        rows = iter(rows)
+        with self.transaction("insert_many") as cursor:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                cursor.executemany(query, [(user_id, product, to_kopecks(price), comment, category_id, date)
+                                           for product, price, comment, category_id, date in batch])
+                inserted += len(batch)
+                months.update(month_start(row[4]) for row in batch)
+                if progress:
+                    progress(inserted)
+            self._refresh_summary_months(cursor, user_id, months)
+        self.search_cache.invalidate_user(user_id)
+        return inserted
+
+    def _refresh_summary_months(self, cursor, user_id, months):
+        """Пересчитывает строки buy_summary пользователя за указанные месяцы по записям buy."""
+        b = self.backend
+        for month in sorted(months):
+            cursor.execute(f"""
+                INSERT INTO buy_summary (id_user, category_id, month, total, entries)
+                SELECT %s, COALESCE(b.category_id, 0), %s, SUM(b.price), COUNT(*)
                 FROM buy b
-                LEFT JOIN categories c ON b.category_id = c.id
-                GROUP BY c.name
-                ORDER BY SUM(b.price) DESC
-                LIMIT 1
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            cursor.close()
+                WHERE {b.same("b.id_user")} AND b.date >= %s AND b.date < %s
+                GROUP BY 2
+                {b.on_conflict(SUMMARY_KEY)}
+                    total = {b.excluded("total")},
+                    entries = {b.excluded("entries")}
+            """, (user_id or 0, month, user_id, month, next_month(month)))
+
+    def add_recurring(self, user_id, product, price, comment, category_id, period, start_date, end_date=None):
+        """Добавляет правило повторяющегося расхода и возвращает его id (None при ошибке).
+
+        Записи в buy по правилу добавляет materialize_recurring, начиная со start_date.
+        """
+        if period not in RECURRING_PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        try:
+            with self.transaction("add_recurring") as cursor:
+                cursor.execute("""
+                    INSERT INTO recurring (id_user, product, price, comment, category_id, period,
+                                           start_date, next_date, end_date)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (user_id, product, to_kopecks(price), comment, category_id, period,
+                      start_date, start_date, end_date))
+                return cursor.lastrowid
+        except Error as e:
+            print(f"Ошибка добавления повторяющегося расхода: {e}")
+            return None
+
+    def get_recurring(self, user_id):
+        """Правила пользователя: (id, product, price, comment, category_id, period, start_date, next_date, end_date)."""
+        try:
+            with self.cursor("get_recurring") as cursor:
+                cursor.execute(f"""
+                    SELECT r.id, r.product, r.price, r.comment, r.category_id, r.period,
+                           r.start_date, r.next_date, r.end_date
+                    FROM recurring r
+                    WHERE {self.backend.same("r.id_user")}
+                    ORDER BY r.id
+                """, (user_id,))
+                return with_money(cursor.fetchall())
+        except Error as e:
+            print(f"Ошибка получения повторяющихся расходов: {e}")
+            return []
+
+    def delete_recurring(self, user_id, id):
+        """Удаляет правило пользователя; уже добавленные по нему записи остаются.
+
+        Возвращает True, если правило найдено и удалено.
+        """
+        try:
+            with self.transaction("delete_recurring") as cursor:
+                cursor.execute(f"DELETE FROM recurring WHERE id = %s AND {self.backend.same('id_user')}",
+                               (id, user_id))
+                return cursor.rowcount > 0
+        except Error as e:
+            print(f"Ошибка удаления повторяющегося расхода: {e}")
+            return False
+
+    def materialize_recurring(self, today, rule_ids=None, batch_size=1000):
+        """Добавляет в buy все повторения правил с датой не позже today; возвращает число записей.
+
+        Пропущенные периоды догоняются за один проход: даты считаются в Python,
+        записи добавляются пачками через executemany, прибавка к buy_summary
+        собирается по (пользователь, категория, месяц) и записывается одним
+        executemany, а next_date всех правил
+        обновляется одним executemany. Все выполняется в одной транзакции, и правила
+        блокируются до ее конца, поэтому повторный или одновременный запуск не
+        добавит записи дважды. rule_ids ограничивает обработку указанными правилами.
+        Ошибки базы данных не перехватываются: транзакция откатывается целиком.
+        """
+        b = self.backend
+        query = f"""
+            SELECT r.id, r.id_user, r.product, r.price, r.comment, r.category_id, r.period,
+                   r.start_date, r.next_date, r.end_date
+            FROM recurring r
+            WHERE r.next_date <= %s AND (r.end_date IS NULL OR r.next_date <= r.end_date)
+        """
+        with self.transaction("materialize_recurring") as cursor:
+            rules = []
+            for chunk in chunks(rule_ids, ID_BATCH_SIZE) if rule_ids is not None else [None]:
+                if chunk is None:
+                    cursor.execute(f"{query} ORDER BY r.id{b.for_update}", (today,))
+                else:
+                    cursor.execute(f"{query} AND r.id IN ({placeholders(chunk)}) ORDER BY r.id{b.for_update}",
+                                   (today, *chunk))
+                rules.extend(cursor.fetchall())
+
+            rows = []
+            advanced = []
+            summary = {}  # (id_user, category_id, month) -> [сумма, записей]
+            for id, user_id, product, price, comment, category_id, period, start, day, end in rules:
+                last = min(today, end) if end else today
+                while day <= last:
+                    rows.append((user_id, product, price, comment, category_id, day))
+                    totals = summary.setdefault((user_id or 0, category_id or 0, month_start(day)), [0, 0])
+                    totals[0] += price
+                    totals[1] += 1
+                    day = next_occurrence(day, period, start.day)
+                advanced.append((day, id))
+
+            for batch in chunks(rows, batch_size):
+                cursor.executemany("""
+                    INSERT INTO buy (id_user, product, price, comment, category_id, date)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, batch)
+            if advanced:
+                cursor.executemany("UPDATE recurring SET next_date = %s WHERE id = %s", advanced)
+            if summary:
+                cursor.executemany(f"""
+                    INSERT INTO buy_summary (id_user, category_id, month, total, entries)
+                    VALUES (%s, %s, %s, %s, %s)
+                    {b.on_conflict(SUMMARY_KEY)}
+                        total = total + {b.excluded("total")},
+                        entries = entries + {b.excluded("entries")}
+                """, [(*key, total, entries) for key, (total, entries) in summary.items()])
+        for user_id in {row[0] for row in rows}:
+            self.search_cache.invalidate_user(user_id)
+        return len(rows)
+
+    def set_budget_limit(self, user_id, category_id, amount):
+        """Устанавливает месячный лимит расходов категории (amount — рубли); amount=None снимает лимит.
+
+        category_id=None — записи без категории. Возвращает False при ошибке.
+        """
+        try:
+            with self.transaction("set_budget_limit") as cursor:
+                if amount is None:
+                    cursor.execute("DELETE FROM budget_limits WHERE id_user = %s AND category_id = %s",
+                                   (user_id or 0, category_id or 0))
+                else:
+                    cursor.execute(f"""
+                        INSERT INTO budget_limits (id_user, category_id, amount)
+                        VALUES (%s, %s, %s)
+                        {self.backend.on_conflict(("id_user", "category_id"))}
+                            amount = {self.backend.excluded("amount")}
+                    """, (user_id or 0, category_id or 0, to_kopecks(amount)))
+            return True
+        except Error as e:
+            print(f"Ошибка сохранения лимита: {e}")
+            return False
+
+    def get_budget_limits(self, user_id, day=None):
+        """Лимиты пользователя и расходы за месяц даты day (по умолчанию текущий).
+
+        Возвращает список (название категории или None, лимит, потрачено) в Decimal рублей.
+        """
+        try:
+            with self.cursor("get_budget_limits") as cursor:
+                cursor.execute("""
+                    SELECT l.category_id, l.amount, COALESCE(s.total, 0)
+                    FROM budget_limits l
+                    LEFT JOIN buy_summary s
+                        ON s.id_user = l.id_user AND s.category_id = l.category_id AND s.month = %s
+                    WHERE l.id_user = %s
+                    ORDER BY l.category_id
+                """, (month_start(day or date.today()), user_id or 0))
+                rows = cursor.fetchall()
+            names = self.categories
+            return [(names.name_by_id(category_id) if category_id else None, from_kopecks(amount), from_kopecks(spent))
+                    for category_id, amount, spent in rows]
+        except Error as e:
+            print(f"Ошибка получения лимитов: {e}")
+            return []
+
+    def check_budget(self, user_id, category_id, day):
+        """Лимит категории и расходы за месяц даты day: (лимит, потрачено) в Decimal рублей.
+
+        None, если лимит не установлен. Выполняется после каждого добавления
+        и изменения записи, поэтому читает одну строку budget_limits и одну строку
+        сводки buy_summary по первичным ключам, не обращаясь к buy.
+        """
+        try:
+            with self.cursor("check_budget") as cursor:
+                cursor.execute("""
+                    SELECT l.amount, COALESCE(s.total, 0)
+                    FROM budget_limits l
+                    LEFT JOIN buy_summary s
+                        ON s.id_user = l.id_user AND s.category_id = l.category_id AND s.month = %s
+                    WHERE l.id_user = %s AND l.category_id = %s
+                """, (month_start(day), user_id or 0, category_id or 0))
+                row = cursor.fetchone()
+            return (from_kopecks(row[0]), from_kopecks(row[1])) if row else None
+        except Error as e:
+            print(f"Ошибка проверки лимита: {e}")
+            return None
+
+    def get_total_spent(self, user_id):
+        try:
+            with self.cursor("get_total_spent") as cursor:
+                cursor.execute("SELECT SUM(total) FROM buy_summary WHERE id_user = %s", (user_id or 0,))
+                total = cursor.fetchone()[0]
+            return from_kopecks(total)
+        except Error as e:
+            print(f"Ошибка подсчета общей суммы: {e}")
+            return ZERO
+
+    def get_top_category(self, user_id):
+        try:
+            with self.cursor("get_top_category") as cursor:
+                query = """
+                    SELECT c.name, SUM(s.total)
+                    FROM buy_summary s
+                    LEFT JOIN categories c ON s.category_id = c.id
+                    WHERE s.id_user = %s
+                    GROUP BY c.name
+                    ORDER BY SUM(s.total) DESC, c.name
+                    LIMIT 1
+                """
+                cursor.execute(query, (user_id or 0,))
+                result = cursor.fetchone()
             if result:
-                return result[0] or "Нет данных", result[1] or 0.0
-            return "Нет данных", 0.0
+                return result[0] or "Нет данных", from_kopecks(result[1])
+            return "Нет данных", ZERO
         except Error as e:
             print(f"Ошибка получения топ-категории: {e}")
-            return "Нет данных", 0.0
+            return "Нет данных", ZERO
+
+    def get_spend_series(self, user_id, start, end, bucket="day"):
+        """Суммы расходов пользователя по категориям за дни или месяцы от start до end включительно.
+
+        Возвращает список (день или первое число месяца, название категории или None,
+        сумма в Decimal рублей, число записей) по возрастанию даты. Дни считаются по диапазону индекса
+        (id_user, date) таблицы buy, месяцы — по сводке buy_summary целиком
+        (в том числе для start и end в середине месяца).
+        """
+        try:
+            with self.cursor("get_spend_series") as cursor:
+                if bucket == "month":
+                    cursor.execute("""
+                        SELECT month, category_id, SUM(total), SUM(entries)
+                        FROM buy_summary
+                        WHERE id_user = %s AND month >= %s AND month <= %s
+                        GROUP BY month, category_id
+                        ORDER BY month
+                    """, (user_id or 0, month_start(start), end))
+                else:
+                    cursor.execute(f"""
+                        SELECT b.date, COALESCE(b.category_id, 0), SUM(b.price), COUNT(*)
+                        FROM buy b
+                        WHERE {self.backend.same("b.id_user")} AND b.date >= %s AND b.date <= %s
+                        GROUP BY b.date, COALESCE(b.category_id, 0)
+                        ORDER BY b.date
+                    """, (user_id, start, end))
+                rows = cursor.fetchall()
+            names = self.categories
+            return [(day, names.name_by_id(category_id) if category_id else None, from_kopecks(total), int(entries))
+                    for day, category_id, total, entries in rows]
+        except Error as e:
+            print(f"Ошибка получения статистики по периодам: {e}")
+            return []
+
+    def rebuild_summary(self):
+        """Пересчитывает сводную таблицу buy_summary по всем записям buy."""
+        with self.transaction("rebuild_summary") as cursor:
+            cursor.execute("DELETE FROM buy_summary")
+            cursor.execute(f"""
+                INSERT INTO buy_summary (id_user, category_id, month, total, entries)
+                SELECT COALESCE(id_user, 0), COALESCE(category_id, 0), {self.backend.month_start("date")},
+                       SUM(price), COUNT(*)
+                FROM buy
+                GROUP BY 1, 2, 3
+            """)
+        # Статистика в кэше могла считаться по расходившейся сводке
+        self.search_cache.clear()
+
+    def verify_summary(self):
+        """Сравнивает buy_summary с пересчетом по buy.
+
+        Возвращает список расхождений в виде кортежей (id_user, category_id, month,
+        total_in_buy, total_in_summary, entries_in_buy, entries_in_summary);
+        суммы — Decimal рублей. Суммы в копейках сравниваются точно.
+        """
+        with self.cursor("verify_summary") as cursor:
+            cursor.execute(f"""
+                SELECT COALESCE(id_user, 0), COALESCE(category_id, 0), {self.backend.month_start("date")},
+                       SUM(price), COUNT(*)
+                FROM buy
+                GROUP BY 1, 2, 3
+            """)
+            expected = {(row[0], row[1], str(row[2])): (int(row[3] or 0), row[4]) for row in cursor.fetchall()}
+            cursor.execute("SELECT id_user, category_id, month, total, entries FROM buy_summary")
+            actual = {(row[0], row[1], str(row[2])): (int(row[3]), row[4]) for row in cursor.fetchall()}
+
+        drift = []
+        for key in sorted(expected.keys() | actual.keys()):
+            expected_total, expected_entries = expected.get(key, (0, 0))
+            actual_total, actual_entries = actual.get(key, (0, 0))
+            if expected_entries != actual_entries or expected_total != actual_total:
+                drift.append((*key, from_kopecks(expected_total), from_kopecks(actual_total),
+                              expected_entries, actual_entries))
+        return drift
+
+    def close(self):
+        """Закрывает все подключения пула."""
+        self.pool.close()
+        print("Подключения к базе данных закрыты")
 
     def __del__(self):
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Подключение к MySQL закрыто")
\ No newline at end of file
+        self.pool.close()
+
+
+class AsyncDB:
+    """Асинхронный доступ к DB для обработчиков событий Flet.
+
+    Методы DB выполняются в ограниченном пуле потоков (по умолчанию по одному
+    потоку на подключение пула) и возвращают корутины, поэтому медленный запрос
+    не останавливает цикл событий. Методы, которые хэшируют пароли, выполняются
+    в отдельном небольшом пуле, чтобы долгие вычисления не задерживали запросы
+    остальных сессий. Как есть доступны только методы из NON_BLOCKING и атрибуты
+    DB, которые не являются функциями: новый метод DB по умолчанию попадает в пул.
+    """
+
+    NON_BLOCKING = frozenset({"page_key"})
+    PASSWORD_HASHING = frozenset({"register_user", "authenticate"})
+
+    def __init__(self, db, max_workers=None, password_workers=2):
+        self.db = db
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or db.pool.size,
+            thread_name_prefix="db")
+        self.password_executor = ThreadPoolExecutor(
+            max_workers=password_workers,
+            thread_name_prefix="password")
+
+    async def run(self, func, *args, executor=None, **kwargs):
+        """Выполняет блокирующую функцию в пуле потоков (по умолчанию self.executor) с текущим контекстом."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor or self.executor, lambda: context.run(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr) or name in self.NON_BLOCKING:
+            return attr
+        executor = self.password_executor if name in self.PASSWORD_HASHING else self.executor
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, executor=executor, **kwargs)
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.password_executor.shutdown(wait=True)
+        self.db.close()
@@ -10,10 +10,15 @@ CREATE TABLE IF NOT EXISTS buy (
     id INT AUTO_INCREMENT PRIMARY KEY,
     id_user INT,
     product VARCHAR(255),
-    price FLOAT,
+    price BIGINT NOT NULL,  -- стоимость в копейках
     comment TEXT,
     category_id INT,
     date DATE,
+    INDEX idx_buy_date (date),
+    INDEX idx_buy_user_date (id_user, date),
+    INDEX idx_buy_user_date_amount (id_user, date, category_id, price),
+    INDEX idx_buy_category (category_id),
+    FULLTEXT INDEX ft_buy_text (product, comment) WITH PARSER ngram,
     FOREIGN KEY (category_id) REFERENCES categories(id)
         ON DELETE SET NULL
         ON UPDATE CASCADE
@@ -30,5 +35,185 @@ CREATE TABLE IF NOT EXISTS users (
     id INT AUTO_INCREMENT PRIMARY KEY,
     login VARCHAR(255),
     email VARCHAR(255),
-    password VARCHAR(255)
-)
+    password VARCHAR(255),
+    UNIQUE INDEX ux_users_login (login),
+    UNIQUE INDEX ux_users_email (email)
+);
+
+-- Уникальность логина и email в базах, созданных до появления индексов.
+-- Если команда завершилась ошибкой Duplicate entry, сначала удалите повторяющихся пользователей.
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = 'ux_users_login') = 0,
+    'ALTER TABLE users ADD UNIQUE INDEX ux_users_login (login)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = 'ux_users_email') = 0,
+    'ALTER TABLE users ADD UNIQUE INDEX ux_users_email (email)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Перевод стоимости из FLOAT в целые копейки для баз, созданных до этого.
+-- Значения округляются до копеек через DECIMAL; покрывающий индекс по price
+-- удаляется и создается заново ниже.
+SET @price_is_float = (
+    SELECT COUNT(*) FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = 'buy' AND column_name = 'price'
+      AND data_type IN ('float', 'double'));
+
+SET @ddl = IF(@price_is_float = 1, 'ALTER TABLE buy ADD COLUMN price_kopecks BIGINT', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(@price_is_float = 1,
+    'UPDATE buy SET price_kopecks = ROUND(CAST(COALESCE(price, 0) AS DECIMAL(16, 2)) * 100)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    @price_is_float = 1 AND (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'idx_buy_user_date_amount') > 0,
+    'ALTER TABLE buy DROP INDEX idx_buy_user_date_amount',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(@price_is_float = 1, 'ALTER TABLE buy DROP COLUMN price', 'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(@price_is_float = 1,
+    'ALTER TABLE buy CHANGE COLUMN price_kopecks price BIGINT NOT NULL AFTER product',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Сводка расходов по пользователям, категориям и месяцам, поддерживается
+-- DB.insert/update/delete. id_user = 0 и category_id = 0 — записи без владельца
+-- и без категории; month — первое число месяца; total — сумма в копейках.
+CREATE TABLE IF NOT EXISTS buy_summary (
+    id_user INT NOT NULL DEFAULT 0,
+    category_id INT NOT NULL DEFAULT 0,
+    month DATE NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    entries INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_user, category_id, month)
+);
+
+-- Заполнение сводки для уже существующих записей (повторный запуск ничего не меняет).
+-- При расхождениях используйте: python manage.py summary rebuild
+INSERT IGNORE INTO buy_summary (id_user, category_id, month, total, entries)
+SELECT COALESCE(id_user, 0),
+       COALESCE(category_id, 0),
+       COALESCE(DATE_SUB(date, INTERVAL DAYOFMONTH(date) - 1 DAY), '1000-01-01'),
+       SUM(price),
+       COUNT(*)
+FROM buy
+GROUP BY 1, 2, 3;
+
+-- Индекс для постраничного вывода записей (ORDER BY date DESC, id DESC)
+-- в базах, созданных до его появления.
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'idx_buy_date') = 0,
+    'ALTER TABLE buy ADD INDEX idx_buy_date (date)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Индексы поиска: по пользователю и дате, по категории и полнотекстовый
+-- ngram-индекс по названию и комментарию (подходит для кириллицы).
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'idx_buy_user_date') = 0,
+    'ALTER TABLE buy ADD INDEX idx_buy_user_date (id_user, date)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Покрывающий индекс для аналитики по дням и неделям (DB.get_spend_series):
+-- суммы за диапазон дат считаются без обращения к строкам таблицы.
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'idx_buy_user_date_amount') = 0,
+    'ALTER TABLE buy ADD INDEX idx_buy_user_date_amount (id_user, date, category_id, price)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'idx_buy_category') = 0,
+    'ALTER TABLE buy ADD INDEX idx_buy_category (category_id)',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @ddl = IF(
+    (SELECT COUNT(*) FROM information_schema.statistics
+     WHERE table_schema = DATABASE() AND table_name = 'buy' AND index_name = 'ft_buy_text') = 0,
+    'ALTER TABLE buy ADD FULLTEXT INDEX ft_buy_text (product, comment) WITH PARSER ngram',
+    'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Ключи изменений, примененных из локальной очереди приложения (outbox.py).
+-- Изменение с уже записанным ключом при повторной отправке пропускается.
+-- Старые ключи удаляет: python manage.py outbox purge
+CREATE TABLE IF NOT EXISTS applied_operations (
+    op_key CHAR(32) PRIMARY KEY,
+    applied_at DATETIME NOT NULL,
+    INDEX idx_applied_operations_at (applied_at)
+);
+
+-- Повторяющиеся расходы (аренда, подписки). Правило добавляет запись в buy каждый
+-- день (day), неделю (week) или месяц (month) начиная со start_date и до end_date
+-- включительно; для месяцев число берется из start_date (31-е — последний день
+-- коротких месяцев). next_date — дата следующей еще не добавленной записи,
+-- price — стоимость в копейках. Записи добавляет DB.materialize_recurring.
+CREATE TABLE IF NOT EXISTS recurring (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    id_user INT,
+    product VARCHAR(255) NOT NULL,
+    price BIGINT NOT NULL,
+    comment TEXT,
+    category_id INT,
+    period ENUM('day', 'week', 'month') NOT NULL,
+    start_date DATE NOT NULL,
+    next_date DATE NOT NULL,
+    end_date DATE,
+    INDEX idx_recurring_next (next_date),
+    INDEX idx_recurring_user (id_user),
+    FOREIGN KEY (category_id) REFERENCES categories(id)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE
+);
+
+-- Месячные лимиты расходов по категориям. id_user = 0 и category_id = 0, как и в
+-- buy_summary, — записи без владельца и без категории; amount — лимит в копейках.
+-- Проверка лимита (DB.check_budget) читает по одной строке budget_limits и buy_summary
+-- по первичным ключам, поэтому ее время не зависит от числа записей.
+CREATE TABLE IF NOT EXISTS budget_limits (
+    id_user INT NOT NULL DEFAULT 0,
+    category_id INT NOT NULL DEFAULT 0,
+    amount BIGINT NOT NULL,
+    PRIMARY KEY (id_user, category_id)
+);
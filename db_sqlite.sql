@@ -0,0 +1,107 @@
+-- Схема встроенной базы SQLite (см. SQLiteBackend); повторяет db.sql для MySQL.
+-- Выполняется при каждом подключении, поэтому все команды идемпотентны.
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(255) UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS buy (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_user INT,
+    product VARCHAR(255),
+    price INTEGER NOT NULL,  -- стоимость в копейках
+    comment TEXT,
+    category_id INT REFERENCES categories(id)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE,
+    date DATE
+);
+
+CREATE INDEX IF NOT EXISTS idx_buy_date ON buy (date);
+CREATE INDEX IF NOT EXISTS idx_buy_user_date ON buy (id_user, date);
+-- Покрывающий индекс для аналитики по дням и неделям (DB.get_spend_series)
+CREATE INDEX IF NOT EXISTS idx_buy_user_date_amount ON buy (id_user, date, category_id, price);
+CREATE INDEX IF NOT EXISTS idx_buy_category ON buy (category_id);
+
+-- Полнотекстовый индекс по названию и комментарию, синхронизируется триггерами
+CREATE VIRTUAL TABLE IF NOT EXISTS buy_fts USING fts5(
+    product, comment,
+    content = 'buy', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS buy_fts_insert AFTER INSERT ON buy BEGIN
+    INSERT INTO buy_fts (rowid, product, comment) VALUES (new.id, new.product, new.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS buy_fts_delete AFTER DELETE ON buy BEGIN
+    INSERT INTO buy_fts (buy_fts, rowid, product, comment) VALUES ('delete', old.id, old.product, old.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS buy_fts_update AFTER UPDATE OF product, comment ON buy BEGIN
+    INSERT INTO buy_fts (buy_fts, rowid, product, comment) VALUES ('delete', old.id, old.product, old.comment);
+    INSERT INTO buy_fts (rowid, product, comment) VALUES (new.id, new.product, new.comment);
+END;
+
+INSERT OR IGNORE INTO categories (name) VALUES
+    ('Продукты'),
+    ('Транспорт'),
+    ('Жилье'),
+    ('Развлечения'),
+    ('Другое');
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    login VARCHAR(255),
+    email VARCHAR(255),
+    password VARCHAR(255)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_users_login ON users (login);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_users_email ON users (email);
+
+-- Сводка расходов по пользователям, категориям и месяцам (см. db.sql)
+CREATE TABLE IF NOT EXISTS buy_summary (
+    id_user INT NOT NULL DEFAULT 0,
+    category_id INT NOT NULL DEFAULT 0,
+    month DATE NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,  -- сумма в копейках
+    entries INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_user, category_id, month)
+) WITHOUT ROWID;
+
+-- Ключи изменений, примененных из локальной очереди приложения (см. db.sql)
+CREATE TABLE IF NOT EXISTS applied_operations (
+    op_key TEXT PRIMARY KEY,
+    applied_at DATETIME NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_applied_operations_at ON applied_operations (applied_at);
+
+-- Повторяющиеся расходы (см. db.sql)
+CREATE TABLE IF NOT EXISTS recurring (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_user INT,
+    product VARCHAR(255) NOT NULL,
+    price INTEGER NOT NULL,  -- стоимость в копейках
+    comment TEXT,
+    category_id INT REFERENCES categories(id)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE,
+    period TEXT NOT NULL CHECK (period IN ('day', 'week', 'month')),
+    start_date DATE NOT NULL,
+    next_date DATE NOT NULL,
+    end_date DATE
+);
+
+CREATE INDEX IF NOT EXISTS idx_recurring_next ON recurring (next_date);
+CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring (id_user);
+
+-- Месячные лимиты расходов по категориям (см. db.sql)
+CREATE TABLE IF NOT EXISTS budget_limits (
+    id_user INT NOT NULL DEFAULT 0,
+    category_id INT NOT NULL DEFAULT 0,
+    amount INTEGER NOT NULL,  -- лимит в копейках
+    PRIMARY KEY (id_user, category_id)
+) WITHOUT ROWID;
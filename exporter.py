@@ -0,0 +1,174 @@
+"""Потоковая выгрузка истории расходов в CSV и в компактный колоночный формат.
+
+Записи читаются из DB.iter_export порциями, поэтому память не зависит от размера истории.
+
+Колоночный формат (.buycol) устроен как упрощенный Parquet: после заголовка MAGIC
+идут группы строк, каждая начинается с числа строк (uint32) и содержит колонки
+id, date, price, category, product, comment. Каждая колонка — сжатый zlib блок
+с длиной (uint32) впереди:
+    id        int64, little-endian
+    date      int32 — порядковый номер дня (date.toordinal()), 0 — без даты
+    price     int64 — копейки
+    category  uint16 коды словаря группы (0 — без категории) и сам словарь строк
+    product,
+    comment   uint32 смещения и строки UTF-8 подряд
+Файл заканчивается группой из нуля строк.
+"""
+import array
+import csv
+import struct
+import sys
+import zlib
+from datetime import date
+
+from money import from_kopecks, to_kopecks
+
+MAGIC = b"BUYCOL1\n"
+CSV_COLUMNS = ("id", "date", "product", "price", "category", "comment")
+FORMATS = ("csv", "columnar")
+ROW_GROUP_SIZE = 10000
+
+
+def export_csv(rows, file):
+    """Пишет записи в CSV; колонки совпадают с форматом "generic" импорта. Возвращает число строк."""
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for id, day, product, price, category, comment in rows:
+        writer.writerow((id, day.isoformat() if day else "", product, price, category or "", comment or ""))
+        count += 1
+    return count
+
+
+def _pack(values):
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, data):
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def _pack_strings(strings):
+    offsets = array.array("I", [0])
+    blob = bytearray()
+    for value in strings:
+        blob += (value or "").encode("utf-8")
+        offsets.append(len(blob))
+    return struct.pack("<I", len(offsets)) + _pack(offsets) + bytes(blob)
+
+
+def _unpack_strings(data):
+    (count,) = struct.unpack_from("<I", data)
+    offsets = _unpack("I", data[4:4 + count * 4])
+    blob = data[4 + count * 4:]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count - 1)]
+
+
+def _write_chunk(file, data):
+    data = zlib.compress(data)
+    file.write(struct.pack("<I", len(data)))
+    file.write(data)
+
+
+def _read_chunk(file):
+    (size,) = struct.unpack("<I", file.read(4))
+    return zlib.decompress(file.read(size))
+
+
+def _write_row_group(file, group):
+    ids = array.array("q")
+    days = array.array("i")
+    prices = array.array("q")
+    codes = array.array("H")
+    dictionary = {}
+    products = []
+    comments = []
+    for id, day, product, price, category, comment in group:
+        ids.append(id)
+        days.append(day.toordinal() if day else 0)
+        prices.append(to_kopecks(price))
+        codes.append(dictionary.setdefault(category, len(dictionary) + 1) if category else 0)
+        products.append(product)
+        comments.append(comment)
+
+    file.write(struct.pack("<I", len(group)))
+    _write_chunk(file, _pack(ids))
+    _write_chunk(file, _pack(days))
+    _write_chunk(file, _pack(prices))
+    _write_chunk(file, _pack_strings(dictionary) + _pack(codes))
+    _write_chunk(file, _pack_strings(products))
+    _write_chunk(file, _pack_strings(comments))
+
+
+def export_columnar(rows, file, row_group_size=ROW_GROUP_SIZE):
+    """Пишет записи в колоночный формат группами по row_group_size строк. Возвращает число строк."""
+    file.write(MAGIC)
+    count = 0
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) == row_group_size:
+            _write_row_group(file, group)
+            count += len(group)
+            group = []
+    if group:
+        _write_row_group(file, group)
+        count += len(group)
+    file.write(struct.pack("<I", 0))
+    return count
+
+
+def read_columnar(file):
+    """Читает колоночный файл по группам строк.
+
+    Выдает словари колонок: id, date (порядковые номера дней, 0 — без даты) и price
+    (копейки) — массивы array, category, product и comment — списки строк
+    (None — без категории).
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Файл не в колоночном формате выгрузки")
+    while True:
+        (count,) = struct.unpack("<I", file.read(4))
+        if not count:
+            return
+        ids = _unpack("q", _read_chunk(file))
+        days = _unpack("i", _read_chunk(file))
+        prices = _unpack("q", _read_chunk(file))
+        category_data = _read_chunk(file)
+        names = _unpack_strings(category_data)
+        codes = _unpack("H", category_data[len(category_data) - count * 2:])
+        lookup = [None] + names
+        yield {
+            "id": ids,
+            "date": days,
+            "price": prices,
+            "category": [lookup[code] for code in codes],
+            "product": _unpack_strings(_read_chunk(file)),
+            "comment": _unpack_strings(_read_chunk(file)),
+        }
+
+
+def iter_columnar_rows(file):
+    """Читает колоночный файл построчно в том же виде, в каком выдает DB.iter_export."""
+    for group in read_columnar(file):
+        for i, price in enumerate(map(from_kopecks, group["price"])):
+            day = group["date"][i]
+            yield (group["id"][i], date.fromordinal(day) if day else None, group["product"][i],
+                   price, group["category"][i], group["comment"][i])
+
+
+def export_file(db, user_id, path, fmt="csv"):
+    """Выгружает все записи пользователя в файл. Возвращает число выгруженных строк."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    if fmt == "csv":
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            return export_csv(db.iter_export(user_id), file)
+    with open(path, "wb") as file:
+        return export_columnar(db.iter_export(user_id), file)
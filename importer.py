@@ -0,0 +1,201 @@
+"""Массовый импорт расходов из CSV-файлов и банковских выписок.
+
+Файл читается потоково: строки разбираются генератором, проверяются и
+передаются в DB.insert_many, который пишет их пачками в одной транзакции.
+"""
+import csv
+import re
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from backends import Error
+from money import parse_money
+
+# Описания поддерживаемых CSV-форматов: разделитель, названия колонок и знак расходов.
+CSV_FORMATS = {
+    "generic": {
+        "delimiter": ",",
+        "columns": {
+            "date": "date",
+            "product": "product",
+            "price": "price",
+            "category": "category",
+            "comment": "comment",
+        },
+        "expenses_negative": False,
+    },
+    # Выписка банка: расходы со знаком минус, поступления пропускаются.
+    "bank": {
+        "delimiter": ";",
+        "columns": {
+            "date": "Дата операции",
+            "product": "Описание",
+            "price": "Сумма операции",
+            "category": "Категория",
+            "comment": None,
+        },
+        "expenses_negative": True,
+    },
+}
+
+FORMATS = tuple(CSV_FORMATS) + ("ofx",)
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%y", "%Y%m%d")
+
+MAX_PRICE = Decimal(1_000_000_000)
+MAX_PRODUCT_LENGTH = 255
+
+OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+class ImportResult:
+    """Итог импорта: число добавленных и пропущенных строк, ошибки по строкам и скорость."""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []  # (номер строки, сообщение)
+        self.failed = None  # ошибка базы данных, из-за которой импорт отменен
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+def read_csv(lines, fmt="generic"):
+    """Читает CSV построчно и выдает (номер строки, запись) с полями date, product, price, category, comment."""
+    spec = CSV_FORMATS[fmt]
+    reader = csv.DictReader(lines, delimiter=spec["delimiter"])
+    for record in reader:
+        yield reader.line_num, {
+            field: (record.get(column) or "").strip() if column else ""
+            for field, column in spec["columns"].items()
+        }
+
+
+def read_ofx(lines):
+    """Читает операции <STMTTRN> из выписки OFX (SGML или XML) и выдает (номер строки, запись)."""
+    record = None
+    start = 0
+    for line_num, line in enumerate(lines, 1):
+        for tag, value in OFX_FIELD.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                record = {"date": "", "product": "", "price": "", "category": "", "comment": ""}
+                start = line_num
+            elif record is not None and tag == "DTPOSTED":
+                record["date"] = value.strip()[:8]
+            elif record is not None and tag == "TRNAMT":
+                record["price"] = value.strip()
+            elif record is not None and tag == "NAME":
+                record["product"] = value.strip()
+            elif record is not None and tag == "MEMO":
+                record["comment"] = value.strip()
+        if record is not None and "</STMTTRN>" in line.upper():
+            yield start, record
+            record = None
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Неверная дата: {value!r}")
+
+
+def parse_price(value):
+    """Разбирает сумму вида "1 234,56", "-1234.56" или "1234,56 ₽" в Decimal рублей."""
+    cleaned = re.sub(r"[\s ₽]|руб\.?", "", value)
+    try:
+        return parse_money(cleaned)
+    except ValueError:
+        raise ValueError(f"Неверная стоимость: {value!r}") from None
+
+
+def parse_record(record, categories, expenses_negative=False, category_map=None, default_category=None):
+    """Проверяет запись и превращает ее в кортеж для DB.insert_many.
+
+    Возвращает None для строк, которые не являются расходами (поступления в выписке).
+    categories — функция, возвращающая id категории по названию (DB.get_category_id).
+    """
+    if not record["product"]:
+        raise ValueError("Не указано название")
+    if len(record["product"]) > MAX_PRODUCT_LENGTH:
+        raise ValueError(f"Название длиннее {MAX_PRODUCT_LENGTH} символов")
+
+    price = parse_price(record["price"])
+    if expenses_negative:
+        if price >= 0:
+            return None
+        price = -price
+    if not 0 < price <= MAX_PRICE:
+        raise ValueError(f"Стоимость вне допустимого диапазона: {record['price']!r}")
+
+    category_name = record["category"]
+    if category_map:
+        category_name = category_map.get(category_name.lower(), category_name)
+    category_id = categories(category_name) if category_name else None
+    if category_id is None and default_category:
+        category_id = categories(default_category)
+
+    return (
+        record["product"],
+        price,
+        record["comment"],
+        category_id,
+        parse_date(record["date"]).isoformat(),
+    )
+
+
+def import_expenses(db, user_id, lines, fmt="generic", batch_size=1000, progress=None,
+                    category_map=None, default_category=None):
+    """Импортирует расходы из строк файла в базу как записи пользователя user_id.
+
+    Строки с ошибками не прерывают импорт, а попадают в result.errors.
+    progress(imported, errors) вызывается после каждой записанной пачки.
+    Все записи добавляются в одной транзакции: при ошибке базы данных
+    не добавляется ничего, а причина сохраняется в result.failed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    records = read_ofx(lines) if fmt == "ofx" else read_csv(lines, fmt)
+    expenses_negative = fmt == "ofx" or CSV_FORMATS[fmt]["expenses_negative"]
+    if category_map:
+        category_map = {key.lower(): value for key, value in category_map.items()}
+    result = ImportResult()
+
+    def valid_rows():
+        for line_num, record in records:
+            try:
+                row = parse_record(record, db.get_category_id, expenses_negative,
+                                   category_map, default_category)
+            except ValueError as e:
+                result.errors.append((line_num, str(e)))
+                continue
+            if row is None:
+                result.skipped += 1
+                continue
+            yield row
+
+    started = time.perf_counter()
+    try:
+        result.imported = db.insert_many(
+            user_id,
+            valid_rows(),
+            batch_size=batch_size,
+            progress=(lambda inserted: progress(inserted, len(result.errors))) if progress else None)
+    except Error as e:
+        result.imported = 0
+        result.failed = str(e)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def import_file(db, user_id, path, fmt="generic", encoding="utf-8-sig", **options):
+    """Импортирует расходы из файла; параметры те же, что у import_expenses."""
+    with open(path, newline="", encoding=encoding) as file:
+        return import_expenses(db, user_id, file, fmt, **options)
@@ -0,0 +1,294 @@
+"""Замеры запросов к базе данных.
+
+Каждый запрос DB выполняется через InstrumentedCursor, который засекает время
+выполнения вместе с чтением результата, считает строки и передает замер в QueryLog
+с названием метода DB и командой контроллера, из которой он вызван.
+QueryLog хранит гистограммы времени в памяти (histograms(), prometheus())
+и журнал медленных запросов, по желанию с планом выполнения (EXPLAIN).
+StartupTimer замеряет этапы запуска сессии: до первой отрисовки и до загрузки данных.
+"""
+import contextvars
+import functools
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from backends import Error
+
+# Команда контроллера, которая выполняется сейчас (см. command()).
+# AsyncDB.run передает контекст в поток пула, поэтому значение видно и в DB.
+current_command = contextvars.ContextVar("current_command", default=None)
+
+# Границы корзин гистограммы времени запроса, в секундах
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SLOW_QUERY_THRESHOLD = 0.5
+
+_SPACES = re.compile(r"\s+")
+
+
+def command(func):
+    """Декоратор команды контроллера: запросы внутри нее помечаются ее названием.
+
+    Вложенные команды (например, update_view внутри add_command) не меняют метку:
+    запрос относится к команде, которую запустил пользователь.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if current_command.get() is not None:
+            return await func(*args, **kwargs)
+        token = current_command.set(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_command.reset(token)
+    return wrapper
+
+
+def print_startup(marks):
+    print("Запуск: " + ", ".join(f"{stage} {seconds * 1000:.0f} мс" for stage, seconds in marks.items()))
+
+
+class StartupTimer:
+    """Время от start до этапов запуска сессии, в секундах: {этап: время}.
+
+    Этапы отмечаются mark() в порядке прохождения, повторная отметка не меняет
+    время. finish() один раз передает отметки в hook (по умолчанию печатает их),
+    например, чтобы сохранять время холодного старта и следить за его ростом.
+    """
+
+    def __init__(self, start=None, hook=print_startup, clock=time.perf_counter):
+        self.clock = clock
+        self.start = clock() if start is None else start
+        self.hook = hook
+        self.marks = {}
+        self.finished = False
+
+    def mark(self, stage):
+        if not self.finished and stage not in self.marks:
+            self.marks[stage] = self.clock() - self.start
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.hook:
+            self.hook(dict(self.marks))
+
+
+class Histogram:
+    """Гистограмма времени запросов одной пары (метод DB, команда)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — больше всех границ
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def observe(self, seconds, rows, error):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.errors += error
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попадает."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class QueryLog:
+    """Гистограммы и журнал медленных запросов.
+
+    slow_threshold — порог в секундах, после которого запрос печатается и попадает
+    в slow_queries (None — не отслеживать). С explain=True для медленных SELECT
+    дополнительно сохраняется план выполнения. Параметры запросов не сохраняются,
+    так как среди них бывают пароли.
+    """
+
+    def __init__(self, slow_threshold=SLOW_QUERY_THRESHOLD, explain=False, buckets=BUCKETS, slow_log_size=100):
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.buckets = tuple(buckets)
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, query, seconds, rows, error=False, explain=None):
+        """Учитывает выполненный запрос; explain() возвращает его план, если запрос медленный."""
+        key = (operation or "", current_command.get() or "")
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds, rows, error)
+
+        if self.slow_threshold is None or seconds < self.slow_threshold:
+            return
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "operation": key[0],
+            "command": key[1],
+            "seconds": seconds,
+            "rows": rows,
+            "query": _SPACES.sub(" ", query).strip(),
+            "plan": explain() if self.explain and explain and not error else None,
+        }
+        self.slow_queries.append(entry)
+        print(f"Медленный запрос {entry['operation']} (команда {entry['command'] or '-'}): "
+              f"{seconds * 1000:.1f} мс, строк {rows}: {entry['query']}")
+        if entry["plan"]:
+            for line in entry["plan"]:
+                print(f"    {line}")
+
+    def histograms(self):
+        """Сводка по парам (метод DB, команда): число запросов, время, строки, ошибки и квантили."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [{
+                "operation": operation,
+                "command": command,
+                "count": h.count,
+                "errors": h.errors,
+                "rows": h.rows,
+                "sum_seconds": h.sum,
+                "max_seconds": h.max,
+                "p50_seconds": h.quantile(0.5),
+                "p95_seconds": h.quantile(0.95),
+                "p99_seconds": h.quantile(0.99),
+                "buckets": dict(zip(self.buckets + (float("inf"),), h.counts)),
+            } for (operation, command), h in items]
+
+    def prometheus(self, prefix="budget_db"):
+        """Гистограммы в текстовом формате Prometheus."""
+        lines = [
+            f"# HELP {prefix}_query_seconds Время выполнения запросов к базе данных",
+            f"# TYPE {prefix}_query_seconds histogram",
+        ]
+        totals = []
+        with self._lock:
+            for (operation, command), h in sorted(self._histograms.items()):
+                labels = f'operation="{operation}",command="{command}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_query_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'{prefix}_query_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"{prefix}_query_seconds_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"{prefix}_query_seconds_count{{{labels}}} {h.count}")
+                totals.append((labels, h.rows, h.errors))
+        lines.append(f"# HELP {prefix}_query_rows_total Строки, прочитанные или измененные запросами")
+        lines.append(f"# TYPE {prefix}_query_rows_total counter")
+        lines.extend(f"{prefix}_query_rows_total{{{labels}}} {rows}" for labels, rows, _ in totals)
+        lines.append(f"# HELP {prefix}_query_errors_total Запросы, завершившиеся ошибкой")
+        lines.append(f"# TYPE {prefix}_query_errors_total counter")
+        lines.extend(f"{prefix}_query_errors_total{{{labels}}} {errors}" for labels, _, errors in totals)
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.slow_queries.clear()
+
+
+class InstrumentedCursor:
+    """Курсор, который передает в QueryLog время и число строк каждого запроса.
+
+    Время запроса включает чтение его результата, поэтому замер завершается
+    при следующем запросе на этом курсоре или при закрытии курсора.
+    """
+
+    def __init__(self, cursor, connection, backend, log, operation=None):
+        self._cursor = cursor
+        self._connection = connection
+        self._backend = backend
+        self._log = log
+        self._operation = operation
+        self._pending = None  # [query, params, seconds, fetched]
+
+    def execute(self, query, params=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(query, params)
+        except Exception:
+            self._log.record(self._operation, query, time.perf_counter() - started, 0, error=True)
+            raise
+        self._pending = [query, params, time.perf_counter() - started, None]
+        return result
+
+    def executemany(self, query, seq_of_params):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            result = self._cursor.executemany(query, seq_of_params)
+        except Exception:
+            self._log.record(self._operation, query, time.perf_counter() - started, 0, error=True)
+            raise
+        self._pending = [query, None, time.perf_counter() - started, None]
+        return result
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending:
+            self._pending[2] += time.perf_counter() - started
+            fetched = 0 if result is None else len(result) if isinstance(result, list) else 1
+            self._pending[3] = (self._pending[3] or 0) + fetched
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _finish(self):
+        if self._pending is None:
+            return
+        query, params, seconds, fetched = self._pending
+        self._pending = None
+        rows = fetched if fetched is not None else max(self._cursor.rowcount or 0, 0)
+        explain = (lambda: self._explain(query, params)) if params is not None else None
+        self._log.record(self._operation, query, seconds, rows, explain=explain)
+
+    def _explain(self, query, params):
+        """План выполнения SELECT на том же подключении (None для остальных запросов или при ошибке)."""
+        if not query.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        try:
+            cursor = self._backend.cursor(self._connection)
+            try:
+                cursor.execute(self._backend.explain(query), params)
+                return [" | ".join(str(value) for value in row) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Error as e:
+            return [f"EXPLAIN не выполнен: {e}"]
@@ -1,20 +1,66 @@
+import threading
+import time
+
+# Начало запуска процесса: от него считается холодный старт первой сессии
+_process_started = time.perf_counter()
+
 import flet as ft
-from database import DB
+from database import DB, AsyncDB
+from instrumentation import StartupTimer, print_startup
 from view import BudgetView
 from registration_view import RegistrationView
 from controller import BudgetController
+from sessions import SessionStore
+from outbox import WriteBehind
+from recurring import RecurringScheduler
+
+# Одна модель (пул подключений и пул потоков), одна очередь изменений, один
+# планировщик повторяющихся расходов и одно хранилище сессий на все сессии процесса
+_model = None
+_writes = None
+_recurring = None
+_model_lock = threading.Lock()
+_sessions = SessionStore()
+
+# Получает {этап: секунды} после запуска каждой сессии: first_paint — первая отрисовка,
+# data — загружены записи (только при входе по сохраненной сессии). Замените, чтобы
+# сохранять время запуска, например, в журнал замеров.
+STARTUP_HOOK = print_startup
+
+
+def get_model():
+    global _model, _writes, _recurring
+    with _model_lock:
+        if _model is None:
+            _model = AsyncDB(DB())
+            _writes = WriteBehind(_model)
+            _recurring = RecurringScheduler(_model)
+        return _model
+
+
+async def main(page: ft.Page):
+    global _process_started
+    # Первая сессия считается от запуска процесса, остальные — от подключения
+    startup = StartupTimer(start=_process_started, hook=STARTUP_HOOK)
+    _process_started = None
 
-def main(page: ft.Page):
-    # Создаем компоненты MVC
-    model = DB()
+    # Создаем компоненты MVC; у каждой сессии Flet они свои.
+    # Подключение к базе откроется при первом запросе.
+    model = get_model()
     registration_view = RegistrationView(None)  # Контроллер будет установлен позже
     view = BudgetView(None)  # Контроллер будет установлен позже
-    controller = BudgetController(model, view, registration_view)
+    controller = BudgetController(model, view, registration_view, _sessions, _writes, startup)
+    # Изменения, оставшиеся в очереди с прошлого запуска, и наступившие
+    # повторяющиеся расходы добавляются в фоне
+    _writes.flush()
+    _recurring.start()
 
     # Устанавливаем текущую страницу
     controller.current_page = page
 
-    # Настраиваем начальный интерфейс (регистрация)
-    registration_view.setup_ui(page)
+    # Сохраненная сессия открывает бюджет сразу, иначе — форма входа и регистрации
+    if not await controller.restore_session_command():
+        registration_view.setup_ui(page)
+        controller.mark_startup("first_paint", finish=True)
 
 ft.app(target=main)
\ No newline at end of file
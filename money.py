@@ -0,0 +1,35 @@
+"""Денежные суммы.
+
+В базе стоимость хранится целым числом копеек (buy.price, buy_summary.total),
+поэтому суммы и сравнения точны. В программе суммы — Decimal в рублях
+с двумя знаками после запятой.
+"""
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+KOPECK = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def parse_money(value):
+    """Разбирает сумму из строки ("1 234,56"), числа или Decimal в Decimal рублей."""
+    try:
+        if isinstance(value, Decimal):
+            amount = value
+        else:
+            amount = Decimal(re.sub(r"\s", "", str(value)).replace(",", "."))
+        if amount.is_finite():
+            return amount.quantize(KOPECK, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        pass
+    raise ValueError(f"Неверная сумма: {value!r}")
+
+
+def to_kopecks(value):
+    """Сумма в рублях (строка, число или Decimal) в целое число копеек для записи в базу."""
+    return int(parse_money(value) * 100)
+
+
+def from_kopecks(value):
+    """Целое число копеек из базы (None — 0) в Decimal рублей."""
+    return Decimal(int(value or 0)).scaleb(-2)
@@ -0,0 +1,225 @@
+"""Локальная очередь изменений на случай, когда база недоступна или медленно отвечает.
+
+Добавление, изменение и удаление записей сначала сохраняются в файл SQLite
+рядом с приложением (Outbox), а затем отправляются в базу пачками через
+DB.apply_operations. У каждого изменения есть ключ идемпотентности: база
+запоминает ключи примененных изменений, поэтому повторная отправка после обрыва
+связи ничего не дублирует.
+
+WriteBehind ждет отправки не дольше timeout секунд; если база не ответила,
+команда продолжается, изменение остается в очереди, а отправка повторяется
+каждые retry_interval секунд. Изменения отправляются в порядке их сохранения.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from backends import Error, is_rejected
+from database import QUEUED_OPERATIONS, DatabaseUnavailable, chunks, placeholders
+
+# Файл очереди; переопределяется переменной окружения OUTBOX_PATH
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "outbox.db")
+
+# Сколько изменений отправляется в базу одной транзакцией
+BATCH_SIZE = 100
+
+
+class Outbox:
+    """Очередь изменений в файле SQLite: (ключ, операция, user_id, аргументы) в порядке добавления.
+
+    Каждое изменение записывается на диск сразу, поэтому очередь переживает
+    перезапуск приложения. Методы можно вызывать из разных потоков.
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op_key TEXT NOT NULL UNIQUE,
+                operation TEXT NOT NULL,
+                user_id INTEGER,
+                args TEXT NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+
+    def put(self, operation, user_id, args):
+        """Сохраняет изменение и возвращает его ключ.
+
+        args — аргументы метода DB после user_id; суммы Decimal и даты сохраняются строками.
+        """
+        if operation not in QUEUED_OPERATIONS:
+            raise ValueError(f"Неизвестная операция: {operation}")
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO outbox (op_key, operation, user_id, args) VALUES (?, ?, ?, ?)",
+                (key, operation, user_id, json.dumps(list(args), default=str, ensure_ascii=False)))
+        return key
+
+    def peek(self, limit=BATCH_SIZE):
+        """Первые limit изменений очереди в виде кортежей для DB.apply_operations."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT op_key, operation, user_id, args FROM outbox ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(key, operation, user_id, tuple(json.loads(args))) for key, operation, user_id, args in rows]
+
+    def remove(self, keys):
+        keys = list(keys)
+        with self._lock:
+            for chunk in chunks(keys, 500):
+                self._connection.execute(
+                    f"DELETE FROM outbox WHERE op_key IN ({placeholders(chunk).replace('%s', '?')})", chunk)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM outbox WHERE op_key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class OperationRejected(Exception):
+    """База отклонила изменение из очереди, и оно удалено из очереди."""
+
+
+def replay(db, outbox, batch_size=BATCH_SIZE, on_reject=None):
+    """Отправляет очередь в базу пачками по batch_size и возвращает число примененных изменений.
+
+    Если база отклоняет пачку (см. backends.is_rejected), изменения отправляются
+    по одному, и отклоненные удаляются из очереди с сообщением; on_reject(key, error)
+    вызывается для каждого из них. Любая другая ошибка базы выбрасывается как
+    DatabaseUnavailable: неотправленные изменения остаются в очереди.
+    """
+    applied = 0
+    while True:
+        batch = outbox.peek(batch_size)
+        if not batch:
+            return applied
+        try:
+            applied += _apply(db, batch)
+        except Error + (ValueError,):
+            applied += _replay_each(db, outbox, batch, on_reject)
+            continue
+        outbox.remove(key for key, _, _, _ in batch)
+
+
+def _apply(db, operations):
+    try:
+        return db.apply_operations(operations)
+    except Error + (ValueError,) as e:
+        if is_rejected(e):
+            raise
+        raise DatabaseUnavailable(str(e)) from e
+
+
+def _replay_each(db, outbox, batch, on_reject):
+    applied = 0
+    for operation in batch:
+        try:
+            applied += _apply(db, [operation])
+        except Error + (ValueError,) as e:
+            print(f"Изменение {operation[1]} ({operation[0]}) отклонено базой и удалено из очереди: {e}")
+            if on_reject is not None:
+                on_reject(operation[0], e)
+        outbox.remove([operation[0]])
+    return applied
+
+
+class WriteBehind:
+    """Отправка изменений через Outbox для обработчиков событий Flet.
+
+    model — AsyncDB; отправка выполняется в его пуле потоков. Запись в файл
+    очереди тоже блокирующая (фиксация SQLite), поэтому она выполняется
+    в отдельном потоке: цикл событий не ждет диск, а сохранение изменения
+    не ждет потоков, занятых медленными запросами к базе. Один объект
+    используется всеми сессиями процесса.
+    """
+
+    def __init__(self, model, outbox=None, batch_size=BATCH_SIZE, timeout=1.0, retry_interval=5.0):
+        self.model = model
+        self.outbox = outbox if outbox is not None else Outbox()
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._task = None
+        self._retry = None
+        self._dirty = False
+        # Отказы базы для изменений, отправки которых ждет submit()
+        self._waiting = set()
+        self._rejected = {}
+
+    @property
+    def offline(self):
+        """True, если последняя отправка не удалась и ожидается повтор."""
+        return self._retry is not None
+
+    async def submit(self, operation, user_id, *args):
+        """Сохраняет изменение в очереди и ждет его отправки не дольше timeout.
+
+        Возвращает True, если изменение уже в базе, и False, если оно отложено.
+        Пока база недоступна, не ждет вовсе. Если база отклонила изменение,
+        вызывает OperationRejected с ее сообщением.
+        """
+        key = await self.model.run(self.outbox.put, operation, user_id, args, executor=self.executor)
+        if self.offline:
+            return False
+        self._waiting.add(key)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.flush()), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiting.discard(key)
+        error = self._rejected.pop(key, None)
+        if error is not None:
+            raise OperationRejected(str(error)) from error
+        return not await self.model.run(self.outbox.__contains__, key, executor=self.executor)
+
+    def _reject(self, key, error):
+        if key in self._waiting:
+            self._rejected[key] = error
+
+    def flush(self):
+        """Запускает отправку очереди, если она еще не идет, и возвращает ее задачу."""
+        # Идущая отправка проверяет флаг после каждого прохода и отправит
+        # изменения, сохраненные после ее последней пачки
+        self._dirty = True
+        if self._task is None or self._task.done():
+            if self._retry is not None:
+                self._retry.cancel()
+                self._retry = None
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+        return self._task
+
+    async def _flush(self):
+        applied = 0
+        while self._dirty:
+            self._dirty = False
+            try:
+                applied += await self.model.run(replay, self.model.db, self.outbox, self.batch_size, self._reject)
+            except DatabaseUnavailable as e:
+                pending = await self.model.run(len, self.outbox, executor=self.executor)
+                print(f"База данных недоступна, изменений в очереди: {pending} ({e})")
+                self._retry = asyncio.get_running_loop().call_later(self.retry_interval, self.flush)
+                break
+        return applied
+
+    def close(self):
+        if self._retry is not None:
+            self._retry.cancel()
+        self.executor.shutdown(wait=True)
+        self.outbox.close()
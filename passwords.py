@@ -0,0 +1,68 @@
+"""Хэширование паролей пользователей алгоритмом scrypt.
+
+Хэш хранится в users.password строкой вида
+    scrypt$<n>$<r>$<p>$<соль base64>$<хэш base64>
+поэтому параметры стоимости можно повышать: старые хэши продолжают проверяться,
+а needs_rehash() подсказывает, что пароль пора перехэшировать при входе.
+Строки без префикса scrypt$ — пароли, сохраненные до появления хэширования.
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+PREFIX = "scrypt"
+
+# Стоимость по умолчанию: около 16 МБ памяти и десятков миллисекунд на хэш
+DEFAULT_N = 2 ** 14
+DEFAULT_R = 8
+DEFAULT_P = 1
+
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+class PasswordHasher:
+    """Хэширует и проверяет пароли; n, r, p — параметры стоимости scrypt.
+
+    Вычисление занимает заметное время, поэтому в приложении методы вызываются
+    из пула потоков (см. AsyncDB), а не в цикле событий.
+    """
+
+    def __init__(self, n=DEFAULT_N, r=DEFAULT_R, p=DEFAULT_P):
+        if n < 2 or n & (n - 1):
+            raise ValueError("Параметр n должен быть степенью двойки")
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 2 ** 20, dklen=KEY_SIZE)
+
+    def hash(self, password):
+        salt = os.urandom(SALT_SIZE)
+        key = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{PREFIX}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(key)}"
+
+    def verify(self, password, stored):
+        """Проверяет пароль по сохраненному хэшу (или по паролю, сохраненному до хэширования)."""
+        if not stored:
+            return False
+        if not stored.startswith(PREFIX + "$"):
+            return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        try:
+            _, n, r, p, salt, key = stored.split("$")
+            expected = base64.b64decode(key)
+            actual = self._derive(password, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, stored):
+        """True, если пароль сохранен без хэша или с другими параметрами стоимости."""
+        return not (stored or "").startswith(f"{PREFIX}${self.n}${self.r}${self.p}$")
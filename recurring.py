@@ -0,0 +1,68 @@
+"""Планировщик повторяющихся расходов.
+
+Правила хранятся в таблице recurring (DB.add_recurring). RecurringScheduler
+периодически вызывает DB.materialize_recurring, которая добавляет в buy все
+наступившие повторения; пропущенные, пока приложение не работало, периоды
+догоняются за один проход. Сегодняшняя дата берется из clock, поэтому
+планировщик можно проверить с подставными часами.
+"""
+import asyncio
+from datetime import date
+
+from backends import Error
+
+# Как часто проверять наступившие повторения, в секундах
+CHECK_INTERVAL = 60 * 60
+
+PERIOD_LABELS = {"day": "каждый день", "week": "каждую неделю", "month": "каждый месяц"}
+
+
+def describe(rule):
+    """Расписание правила из DB.get_recurring одной строкой."""
+    _, _, _, _, _, period, start, next_date, end = rule
+    text = f"{PERIOD_LABELS.get(period, period)} с {start:%d.%m.%Y}"
+    if end:
+        text += f" по {end:%d.%m.%Y}"
+    if not end or next_date <= end:
+        text += f", следующая запись {next_date:%d.%m.%Y}"
+    return text
+
+
+class RecurringScheduler:
+    """Добавляет наступившие повторяющиеся расходы раз в interval секунд.
+
+    model — AsyncDB; clock — функция без аргументов, возвращающая сегодняшнюю дату.
+    Один планировщик работает на весь процесс.
+    """
+
+    def __init__(self, model, clock=date.today, interval=CHECK_INTERVAL):
+        self.model = model
+        self.clock = clock
+        self.interval = interval
+        self._task = None
+
+    async def run_once(self, rule_ids=None):
+        """Добавляет повторения с датой не позже clock(); возвращает число добавленных записей."""
+        try:
+            return await self.model.materialize_recurring(self.clock(), rule_ids)
+        except Error as e:
+            print(f"Ошибка добавления повторяющихся расходов: {e}")
+            return 0
+
+    def start(self):
+        """Запускает периодическую проверку, если она еще не запущена."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+        return self._task
+
+    async def _loop(self):
+        while True:
+            count = await self.run_once()
+            if count:
+                print(f"Добавлено повторяющихся расходов: {count}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
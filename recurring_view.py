@@ -0,0 +1,60 @@
+import flet as ft
+
+from recurring import describe
+from updates import request_update
+
+
+class RecurringView:
+    """Окно повторяющихся расходов пользователя: правила и кнопки их удаления.
+
+    Удаление правила останавливает добавление новых записей; уже добавленные
+    записи остаются в списке покупок.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.dialog = None
+
+    def build(self):
+        view = self.view
+        self.rules = ft.Column(spacing=4, scroll=ft.ScrollMode.AUTO)
+        self.dialog = ft.AlertDialog(
+            title=ft.Text("Повторяющиеся расходы", color=view.text_color, weight=ft.FontWeight.BOLD),
+            content=ft.Container(content=self.rules, width=500, height=300),
+            actions=[ft.TextButton("Закрыть", on_click=lambda e: self.close())],
+            bgcolor=view.background_color)
+
+    def show(self, rules):
+        if self.dialog is None:
+            self.build()
+        self.fill(rules)
+        page = self.view.page
+        if not any(control is self.dialog for control in page.overlay):
+            page.overlay.append(self.dialog)
+        self.dialog.open = True
+        request_update(page)
+
+    def close(self):
+        self.dialog.open = False
+        request_update(self.view.page)
+
+    def fill(self, rules):
+        view = self.view
+        if not rules:
+            self.rules.controls = [ft.Text("Повторяющихся расходов нет", color=view.text_color)]
+            return
+        self.rules.controls = [
+            ft.ListTile(
+                title=ft.Text(f"{rule[1]} — {rule[2]:.2f} руб.", color=view.text_color, weight=ft.FontWeight.BOLD),
+                subtitle=ft.Text(describe(rule), size=14),
+                trailing=ft.IconButton(
+                    ft.Icons.DELETE,
+                    tooltip="Удалить правило",
+                    icon_color=view.text_color,
+                    on_click=self.delete_handler(rule[0])))
+            for rule in rules]
+
+    def delete_handler(self, id):
+        async def handler(e):
+            await self.view.controller.delete_recurring_command(id)
+        return handler
@@ -1,5 +1,7 @@
 import flet as ft
 
+from updates import request_update
+
 class RegistrationView:
     def __init__(self, controller):
         self.controller = controller
@@ -79,11 +81,11 @@ class RegistrationView:
             on_click=self.controller.register_command
         )
 
-        # Кнопка перехода к бюджету
+        # Вход для зарегистрированных пользователей: логин или email и пароль
         self.to_budget_button = ft.TextButton(
-            "Уже есть аккаунт? Перейти к бюджету",
+            "Уже есть аккаунт? Войти",
             style=ft.ButtonStyle(color=self.text_color),
-            on_click=self.controller.switch_to_budget
+            on_click=self.controller.login_command
         )
 
         # Макет страницы
@@ -112,11 +114,11 @@ class RegistrationView:
         """Отображает уведомление об ошибке или успехе."""
         self.page.snack_bar = ft.SnackBar(ft.Text(message))
         self.page.snack_bar.open = True
-        self.page.update()
+        request_update(self.page)
 
     def clear_fields(self):
         """Очищает поля ввода."""
         self.login_text.value = ""
         self.email_text.value = ""
         self.password_text.value = ""
-        self.page.update()
\ No newline at end of file
+        request_update(self.page)
\ No newline at end of file
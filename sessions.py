@@ -0,0 +1,66 @@
+"""Сессии пользователей: токены входа с ограниченным сроком действия.
+
+После входа или регистрации пользователю выдается случайный токен, который
+хранится в браузере (client_storage Flet). При повторном открытии страницы
+контроллер находит по токену id пользователя в SessionStore и не проверяет
+пароль заново. Хранилище общее для всех сессий процесса.
+"""
+import secrets
+import threading
+import time
+
+# Срок действия токена с последнего использования, в секундах
+SESSION_TTL = 7 * 24 * 60 * 60
+
+
+class SessionStore:
+    """Токены сессий в памяти процесса: токен -> (id пользователя, срок действия).
+
+    Срок продлевается при каждом успешном get(). Просроченные токены удаляются
+    при обращении к ним и при выдаче новых.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, user_id):
+        """Выдает новый токен для пользователя."""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._purge()
+            self._sessions[token] = (user_id, self.clock() + self.ttl)
+        return token
+
+    def get(self, token):
+        """Возвращает id пользователя по действующему токену, иначе None."""
+        if not token:
+            return None
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            user_id, expires = session
+            now = self.clock()
+            if expires <= now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (user_id, now + self.ttl)
+            return user_id
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def revoke_user(self, user_id):
+        """Завершает все сессии пользователя."""
+        with self._lock:
+            for token in [token for token, (owner, _) in self._sessions.items() if owner == user_id]:
+                del self._sessions[token]
+
+    def _purge(self):
+        now = self.clock()
+        for token in [token for token, (_, expires) in self._sessions.items() if expires <= now]:
+            del self._sessions[token]
@@ -0,0 +1,47 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import SQLiteBackend, backend_from_url  # noqa: E402
+from database import DB  # noqa: E402
+from passwords import PasswordHasher  # noqa: E402
+
+# SQLite в памяти проверяется всегда, MySQL — если DATABASE_URL указывает на него
+BACKENDS = ["sqlite"] + (["mysql"] if os.environ.get("DATABASE_URL", "").startswith("mysql") else [])
+
+
+def make_backend(name):
+    return SQLiteBackend(":memory:") if name == "sqlite" else backend_from_url()
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return make_backend(request.param)
+
+
+@pytest.fixture
+def db(backend):
+    db = DB(backend, query_log=False, passwords=PasswordHasher(n=2 ** 4))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def users(db):
+    """Два новых пользователя; после теста удаляются вместе с записями и сводкой."""
+    ids = []
+    for _ in range(2):
+        name = f"test_{uuid.uuid4().hex[:12]}"
+        ids.append(db.register_user(name, f"{name}@example.com", "password"))
+    yield ids
+    marks = ", ".join(["%s"] * len(ids))
+    with db.transaction() as cursor:
+        cursor.execute(f"DELETE FROM buy WHERE id_user IN ({marks})", ids)
+        cursor.execute(f"DELETE FROM buy_summary WHERE id_user IN ({marks})", ids)
+        cursor.execute(f"DELETE FROM recurring WHERE id_user IN ({marks})", ids)
+        cursor.execute(f"DELETE FROM budget_limits WHERE id_user IN ({marks})", ids)
+        cursor.execute(f"DELETE FROM users WHERE id IN ({marks})", ids)
@@ -0,0 +1,33 @@
+"""AsyncDB: методы DB выполняются в пуле потоков, а не в цикле событий."""
+import asyncio
+import inspect
+import threading
+
+from database import DB, AsyncDB
+
+
+def test_db_methods_run_in_executor_by_default(db):
+    model = AsyncDB(db)
+    try:
+        public = [name for name, _ in inspect.getmembers(DB, callable) if not name.startswith("_")]
+        for name in public:
+            # close() у AsyncDB свой: он останавливает и пулы потоков
+            if name not in AsyncDB.NON_BLOCKING and name != "close":
+                assert inspect.iscoroutinefunction(getattr(model, name)), name
+        assert model.page_key is db.page_key
+        assert model.search_cache is db.search_cache
+    finally:
+        model.executor.shutdown()
+        model.password_executor.shutdown()
+
+
+def test_new_db_method_is_not_called_on_event_loop(db):
+    threads = []
+    db.custom_query = lambda: threads.append(threading.current_thread().name)
+    model = AsyncDB(db)
+    try:
+        asyncio.run(model.custom_query())
+    finally:
+        model.executor.shutdown()
+        model.password_executor.shutdown()
+    assert threads[0].startswith("db")
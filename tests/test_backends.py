@@ -0,0 +1,155 @@
+"""Общие проверки DB для всех бэкендов (см. BACKENDS в conftest.py)."""
+import threading
+from datetime import date
+from decimal import Decimal
+
+from backends import PoolError
+from database import ConnectionPool
+from money import from_kopecks, to_kopecks
+
+
+def user_drift(db, user_ids):
+    # В общей базе MySQL могут быть чужие данные: смотрим только тестовых пользователей
+    return [row for row in db.verify_summary() if row[0] in user_ids]
+
+
+def test_pool_returns_same_connection_to_nested_acquire(backend):
+    pool = ConnectionPool(backend.connect, size=2)
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+    with pool.connection() as again:
+        assert again is outer
+    assert pool._created == 1
+    pool.close()
+
+
+def test_pool_gives_other_threads_their_own_connection(backend):
+    pool = ConnectionPool(backend.connect, size=1, timeout=0.1)
+    errors = []
+
+    def checkout():
+        try:
+            with pool.connection():
+                pass
+        except PoolError as e:
+            errors.append(e)
+
+    with pool.connection():
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1
+
+    thread = threading.Thread(target=checkout)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    pool.close()
+
+
+def test_money_round_trips_in_kopecks(db, users):
+    user = users[0]
+    category = db.get_category_id("Продукты")
+    first = db.insert(user, "Жвачка", "0.10", "", category, date(2024, 3, 1))
+    db.insert(user, "Спички", Decimal("0.20"), "", category, date(2024, 3, 2))
+    db.insert(user, "Хлеб", "1 234,56", "", category, date(2024, 3, 3))
+
+    prices = {row[0]: row[2] for row in db.search(user)}
+    assert prices[first] == Decimal("0.10")
+    assert sorted(prices.values()) == [Decimal("0.10"), Decimal("0.20"), Decimal("1234.56")]
+    assert db.get_total_spent(user) == Decimal("1234.86")
+    assert from_kopecks(to_kopecks("0.10") + to_kopecks("0.20")) == Decimal("0.30")
+
+
+def test_summary_follows_changes(db, users):
+    user = users[0]
+    food = db.get_category_id("Продукты")
+    other = db.get_category_id("Транспорт")
+    ids = [db.insert(user, f"Покупка {i}", "10.50", "", food, date(2024, 1, 10 + i)) for i in range(4)]
+    db.insert(user, "Такси", "300", "", other, date(2024, 2, 1))
+    assert user_drift(db, users) == []
+
+    db.update(user, ids[0], "Покупка 0", "20.00", "", other, date(2024, 2, 5))
+    db.delete(user, ids[1])
+    db.recategorize_many(user, [ids[2]], other)
+    assert user_drift(db, users) == []
+    assert db.get_top_category(user) == ("Транспорт", Decimal("330.50"))
+
+    db.delete_many(user, ids)
+    assert user_drift(db, users) == []
+    assert db.get_total_spent(user) == Decimal("300.00")
+
+
+def test_summary_drops_emptied_rows(db, users):
+    user = users[0]
+    id = db.insert(user, "Хлеб", "50", "", db.get_category_id("Продукты"), date(2024, 1, 10))
+    db.delete(user, id)
+    assert db.get_top_category(user) == ("Нет данных", Decimal("0.00"))
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM buy_summary WHERE id_user = %s", (user,))
+        assert cursor.fetchone()[0] == 0
+
+
+def test_verify_summary_reports_drift(db, users):
+    user = users[0]
+    db.insert(user, "Хлеб", "50", "", db.get_category_id("Продукты"), date(2024, 1, 10))
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE buy_summary SET total = total + 1 WHERE id_user = %s", (user,))
+    drift = user_drift(db, users)
+    assert len(drift) == 1
+    assert drift[0][3:] == (Decimal("50.00"), Decimal("50.01"), 1, 1)
+
+    db.rebuild_summary()
+    assert user_drift(db, users) == []
+
+
+def test_keyset_paging_visits_every_record_once(db, users):
+    user = users[0]
+    category = db.get_category_id("Продукты")
+    # Несколько записей на одну дату проверяют порядок по id внутри дня
+    for i in range(11):
+        db.insert(user, f"Покупка {i}", "1", "", category, date(2024, 1, 1 + i // 3))
+    db.insert(user, "Без даты", "1", "", category, None)
+
+    pages = []
+    after = None
+    while True:
+        page = db.search(user, after=after, limit=5)
+        if not page:
+            break
+        pages.append(page)
+        after = db.page_key(page[-1])
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [row for page in pages for row in page] == db.search(user)
+
+
+def test_text_search_matches_word_prefixes(db, users):
+    user = users[0]
+    category = db.get_category_id("Продукты")
+    bread = db.insert(user, "Хлеб бородинский", "60", "к ужину", category, date(2024, 1, 1))
+    milk = db.insert(user, "Молоко", "90", "на завтрак", category, date(2024, 1, 2))
+
+    assert [row[0] for row in db.search(user, "хле")] == [bread]
+    assert [row[0] for row in db.search(user, "бород хлеб")] == [bread]
+    assert [row[0] for row in db.search(user, "завт")] == [milk]
+    assert db.search(user, "хлеб молоко") == []
+    assert db.search(user, "сыр") == []
+
+
+def test_other_users_records_are_untouched(db, users):
+    owner, stranger = users
+    category = db.get_category_id("Продукты")
+    id = db.insert(owner, "Хлеб", "50", "", category, date(2024, 1, 10))
+
+    db.update(stranger, id, "Чужой хлеб", "1", "", category, date(2024, 1, 10))
+    db.delete(stranger, id)
+    assert db.delete_many(stranger, [id]) == 0
+    assert db.recategorize_many(stranger, [id], None) == 0
+
+    assert db.search(stranger) == []
+    [row] = db.search(owner)
+    assert row[:3] == (id, "Хлеб", Decimal("50.00"))
+    assert db.get_total_spent(stranger) == Decimal("0.00")
+    assert user_drift(db, users) == []
@@ -0,0 +1,46 @@
+"""Месячные лимиты расходов по категориям."""
+from datetime import date
+from decimal import Decimal
+
+
+def test_check_budget_counts_spending_of_the_month(db, users):
+    user = users[0]
+    food = db.get_category_id("Продукты")
+    assert db.check_budget(user, food, date(2024, 3, 10)) is None
+
+    assert db.set_budget_limit(user, food, "1000")
+    assert db.check_budget(user, food, date(2024, 3, 10)) == (Decimal("1000.00"), Decimal("0.00"))
+
+    db.insert(user, "Хлеб", "600", "", food, date(2024, 3, 1))
+    id = db.insert(user, "Сыр", "500.50", "", food, date(2024, 3, 31))
+    db.insert(user, "Молоко", "90", "", food, date(2024, 4, 1))
+    assert db.check_budget(user, food, date(2024, 3, 10)) == (Decimal("1000.00"), Decimal("1100.50"))
+    assert db.check_budget(user, food, date(2024, 4, 10)) == (Decimal("1000.00"), Decimal("90.00"))
+
+    db.delete(user, id)
+    assert db.check_budget(user, food, date(2024, 3, 10)) == (Decimal("1000.00"), Decimal("600.00"))
+
+
+def test_limits_are_per_user_and_category(db, users):
+    owner, stranger = users
+    food = db.get_category_id("Продукты")
+    db.set_budget_limit(owner, food, "1000")
+    db.set_budget_limit(owner, None, "50")
+    db.insert(owner, "Хлеб", "60", "", None, date(2024, 3, 1))
+
+    assert db.check_budget(stranger, food, date(2024, 3, 1)) is None
+    assert db.check_budget(owner, None, date(2024, 3, 1)) == (Decimal("50.00"), Decimal("60.00"))
+    assert db.get_budget_limits(owner, date(2024, 3, 1)) == [
+        (None, Decimal("50.00"), Decimal("60.00")),
+        ("Продукты", Decimal("1000.00"), Decimal("0.00")),
+    ]
+
+
+def test_limit_can_be_changed_and_removed(db, users):
+    user = users[0]
+    food = db.get_category_id("Продукты")
+    db.set_budget_limit(user, food, "1000")
+    db.set_budget_limit(user, food, "1 500,25")
+    assert db.check_budget(user, food, date(2024, 3, 1))[0] == Decimal("1500.25")
+    db.set_budget_limit(user, food, None)
+    assert db.check_budget(user, food, date(2024, 3, 1)) is None
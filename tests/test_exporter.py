@@ -0,0 +1,60 @@
+"""Выгрузка записей: CSV и колоночный формат читаются обратно без потерь."""
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from exporter import MAGIC, export_columnar, export_csv, export_file, iter_columnar_rows
+from importer import import_expenses
+
+
+@pytest.fixture
+def records(db, users):
+    user = users[0]
+    food = db.get_category_id("Продукты")
+    db.insert(user, "Хлеб", "45.50", "к ужину", food, date(2024, 3, 5))
+    db.insert(user, "Чай, \"зеленый\"", "0.10", "", food, date(2024, 3, 6))
+    db.insert(user, "Без категории", "1234567.89", None, None, None)
+    return user
+
+
+def test_columnar_round_trip(db, records):
+    rows = list(db.iter_export(records))
+    file = io.BytesIO()
+    assert export_columnar(rows, file, row_group_size=2) == 3
+    assert file.getvalue().startswith(MAGIC)
+
+    file.seek(0)
+    read = list(iter_columnar_rows(file))
+    assert read == [(id, day, product, price, category, comment or "")
+                    for id, day, product, price, category, comment in rows]
+    assert read[1][3] == Decimal("0.10")
+
+
+def test_columnar_rejects_other_files():
+    with pytest.raises(ValueError):
+        list(iter_columnar_rows(io.BytesIO(b"id,date\n")))
+
+
+def test_csv_export_imports_back(db, users, records):
+    file = io.StringIO()
+    assert export_csv(db.iter_export(records), file) == 3
+
+    file.seek(0)
+    result = import_expenses(db, users[1], file)
+    # Запись без даты импорт не принимает
+    assert result.imported == 2
+    assert [line for line, _ in result.errors] == [4]
+    copied = [row[1:] for row in db.search(users[1])]
+    original = [row[1:] for row in db.search(records) if row[5] is not None]
+    assert copied == original
+
+
+def test_export_file(db, records, tmp_path):
+    path = tmp_path / "expenses.buycol"
+    assert export_file(db, records, str(path), "columnar") == 3
+    with open(path, "rb") as file:
+        assert [row[2] for row in iter_columnar_rows(file)] == ["Хлеб", "Чай, \"зеленый\"", "Без категории"]
+    with pytest.raises(ValueError):
+        export_file(db, records, str(path), "xml")
@@ -0,0 +1,86 @@
+"""Импорт расходов из CSV и выписок."""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from importer import import_expenses, parse_date, parse_price, read_ofx
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1 234,56", Decimal("1234.56")),
+    ("-1234.56", Decimal("-1234.56")),
+    ("1234,56 ₽", Decimal("1234.56")),
+    ("99 руб.", Decimal("99.00")),
+    ("0.105", Decimal("0.11")),
+])
+def test_parse_price(value, expected):
+    assert parse_price(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "abc", "1,2,3", "NaN"])
+def test_parse_price_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_price(value)
+
+
+@pytest.mark.parametrize("value", ["2024-03-05", "05.03.2024", "05.03.2024 12:30", "05.03.24", "20240305"])
+def test_parse_date(value):
+    assert parse_date(value) == date(2024, 3, 5)
+
+
+def test_read_ofx():
+    lines = """<OFX><BANKTRANLIST>
+<STMTTRN>
+<DTPOSTED>20240305120000
+<TRNAMT>-150.00
+<NAME>Кофейня
+<MEMO>Капучино
+</STMTTRN>
+<STMTTRN><DTPOSTED>20240306<TRNAMT>5000.00<NAME>Зарплата</STMTTRN>
+</BANKTRANLIST></OFX>""".splitlines()
+    records = list(read_ofx(lines))
+    assert records == [
+        (2, {"date": "20240305", "product": "Кофейня", "price": "-150.00", "category": "", "comment": "Капучино"}),
+        (8, {"date": "20240306", "product": "Зарплата", "price": "5000.00", "category": "", "comment": ""}),
+    ]
+
+
+def test_import_generic_csv_reports_bad_rows(db, users):
+    user = users[0]
+    lines = [
+        "date,product,price,category,comment",
+        "2024-03-05,Хлеб,\"45,50\",Продукты,",
+        "2024-03-06,,10,Продукты,",
+        "2024-03-07,Такси,-5,Транспорт,",
+        "31.02.2024,Молоко,90,Продукты,",
+        "07.03.2024,Билет,1 200,Неизвестная,в кино",
+    ]
+    result = import_expenses(db, user, lines)
+
+    assert result.imported == 2
+    assert [line for line, _ in result.errors] == [3, 4, 5]
+    rows = db.search(user)
+    assert [(row[1], row[2], row[4], row[5]) for row in rows] == [
+        ("Билет", Decimal("1200.00"), None, date(2024, 3, 7)),
+        ("Хлеб", Decimal("45.50"), "Продукты", date(2024, 3, 5)),
+    ]
+
+
+def test_import_bank_statement_skips_income(db, users):
+    user = users[0]
+    lines = [
+        "Дата операции;Описание;Сумма операции;Категория",
+        "05.03.2024 12:30:00;Супермаркет;-1 234,56;Супермаркеты",
+        "06.03.2024 09:00:00;Зарплата;50 000,00;Пополнения",
+    ]
+    result = import_expenses(db, user, lines, "bank", category_map={"супермаркеты": "Продукты"})
+
+    assert (result.imported, result.skipped, result.errors) == (1, 1, [])
+    [row] = db.search(user)
+    assert (row[1], row[2], row[4]) == ("Супермаркет", Decimal("1234.56"), "Продукты")
+
+
+def test_import_rejects_unknown_format(db, users):
+    with pytest.raises(ValueError):
+        import_expenses(db, users[0], [], "xlsx")
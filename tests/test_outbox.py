@@ -0,0 +1,104 @@
+"""Локальная очередь изменений: отправка, повторы и отказы базы."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import AsyncDB, DatabaseUnavailable
+from outbox import OperationRejected, Outbox, WriteBehind, replay
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    yield outbox
+    outbox.close()
+
+
+class FailingDB:
+    """Подставная база, у которой apply_operations всегда выбрасывает error."""
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def apply_operations(self, operations):
+        self.calls += 1
+        raise self.error
+
+
+def purchase(db, product, price="10.00"):
+    return product, price, "", db.get_category_id("Продукты"), "2024-01-10"
+
+
+def test_replay_applies_each_operation_once(db, users, outbox):
+    user = users[0]
+    outbox.put("insert", user, purchase(db, "Хлеб"))
+    outbox.put("insert", user, purchase(db, "Молоко"))
+    batch = outbox.peek()
+
+    assert replay(db, outbox) == 2
+    assert len(outbox) == 0
+    # Повторная отправка после обрыва связи ничего не дублирует
+    assert db.apply_operations(batch) == 0
+    assert sorted(row[1] for row in db.search(user)) == ["Молоко", "Хлеб"]
+
+
+@pytest.mark.parametrize("errno", [2003, 2006, 2013, 1040, 1205, 1213])
+def test_replay_keeps_queue_on_transient_mysql_error(outbox, errno):
+    errors = pytest.importorskip("mysql.connector.errors")
+    outbox.put("delete", 1, (1,))
+    db = FailingDB(errors.DatabaseError(msg="transient", errno=errno))
+
+    with pytest.raises(DatabaseUnavailable):
+        replay(db, outbox)
+    assert db.calls == 1
+    assert len(outbox) == 1
+
+
+def test_replay_keeps_queue_when_database_is_locked(outbox):
+    outbox.put("delete", 1, (1,))
+    with pytest.raises(DatabaseUnavailable):
+        replay(FailingDB(sqlite3.OperationalError("database is locked")), outbox)
+    assert len(outbox) == 1
+
+
+def test_replay_drops_rejected_operations_only(db, users, outbox):
+    user = users[0]
+    outbox.put("insert", user, purchase(db, "Хлеб"))
+    bad = outbox.put("insert", user, purchase(db, "Сыр", price="много"))
+    outbox.put("insert", user, purchase(db, "Молоко"))
+    rejected = []
+
+    assert replay(db, outbox, on_reject=lambda key, error: rejected.append(key)) == 2
+    assert rejected == [bad]
+    assert len(outbox) == 0
+    assert sorted(row[1] for row in db.search(user)) == ["Молоко", "Хлеб"]
+
+
+def test_replay_drops_operation_on_integrity_error(outbox):
+    outbox.put("delete", 1, (1,))
+    rejected = []
+    replay(FailingDB(sqlite3.IntegrityError("UNIQUE constraint failed")), outbox,
+           on_reject=lambda key, error: rejected.append(error))
+    assert len(outbox) == 0
+    assert isinstance(rejected[0], sqlite3.IntegrityError)
+
+
+def test_write_behind_reports_rejection(db, users, outbox):
+    user = users[0]
+    model = AsyncDB(db)
+    writes = WriteBehind(model, outbox, timeout=5.0)
+
+    async def submit():
+        assert await writes.submit("insert", user, *purchase(db, "Хлеб"))
+        with pytest.raises(OperationRejected):
+            await writes.submit("insert", user, *purchase(db, "Сыр", price="много"))
+
+    try:
+        asyncio.run(submit())
+    finally:
+        writes.close()
+        model.executor.shutdown()
+        model.password_executor.shutdown()
+    assert [row[1] for row in db.search(user)] == ["Хлеб"]
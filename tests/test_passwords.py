@@ -0,0 +1,56 @@
+"""Хэширование паролей и перехэширование при входе."""
+from passwords import PasswordHasher
+
+
+def stored_password(db, user_id):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT password FROM users WHERE id = %s", (user_id,))
+        return cursor.fetchone()[0]
+
+
+def set_stored_password(db, user_id, value):
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET password = %s WHERE id = %s", (value, user_id))
+
+
+def test_verify_accepts_only_the_right_password():
+    hasher = PasswordHasher(n=2 ** 4)
+    stored = hasher.hash("секрет")
+    assert stored.startswith("scrypt$16$8$1$")
+    assert hasher.verify("секрет", stored)
+    assert not hasher.verify("Секрет", stored)
+    assert not hasher.verify("секрет", "scrypt$16$8$1$испорчено")
+    assert not hasher.verify("", None)
+    assert hasher.hash("секрет") != stored
+
+
+def test_hash_made_with_other_cost_still_verifies_but_needs_rehash():
+    old = PasswordHasher(n=2 ** 4, r=1)
+    new = PasswordHasher(n=2 ** 5)
+    stored = old.hash("секрет")
+    assert new.verify("секрет", stored)
+    assert new.needs_rehash(stored)
+    assert not new.needs_rehash(new.hash("секрет"))
+    assert new.needs_rehash("секрет")
+
+
+def test_authenticate_rehashes_plain_and_outdated_passwords(db, users):
+    user = users[0]
+    with db.cursor() as cursor:
+        cursor.execute("SELECT login FROM users WHERE id = %s", (user,))
+        login = cursor.fetchone()[0]
+
+    set_stored_password(db, user, "password")
+    assert db.authenticate(login, "wrong") is None
+    assert stored_password(db, user) == "password"
+    assert db.authenticate(login, "password") == user
+    rehashed = stored_password(db, user)
+    assert not db.passwords.needs_rehash(rehashed)
+
+    set_stored_password(db, user, PasswordHasher(n=2 ** 5).hash("password"))
+    assert db.authenticate(f"{login}@example.com", "password") == user
+    assert stored_password(db, user).startswith("scrypt$16$")
+
+
+def test_authenticate_unknown_login(db):
+    assert db.authenticate("nobody-here", "password") is None
@@ -0,0 +1,75 @@
+"""Повторяющиеся расходы: догоняющее добавление и месячные даты."""
+import asyncio
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from database import AsyncDB, next_occurrence
+from recurring import RecurringScheduler, describe
+
+
+def dates(db, user_id):
+    return sorted(row[5] for row in db.search(user_id))
+
+
+@pytest.mark.parametrize("day, anchor, expected", [
+    (date(2024, 1, 31), 31, date(2024, 2, 29)),
+    (date(2024, 2, 29), 31, date(2024, 3, 31)),
+    (date(2023, 1, 31), 31, date(2023, 2, 28)),
+    (date(2024, 4, 30), 31, date(2024, 5, 31)),
+    (date(2024, 12, 15), 15, date(2025, 1, 15)),
+])
+def test_month_end_is_clamped(day, anchor, expected):
+    assert next_occurrence(day, "month", anchor) == expected
+
+
+def test_catch_up_adds_missed_periods_once(db, users):
+    user = users[0]
+    rule = db.add_recurring(user, "Аренда", "30000", "", db.get_category_id("Жилье"), "month", date(2024, 1, 31))
+
+    assert db.materialize_recurring(date(2024, 4, 29)) == 3
+    assert dates(db, user) == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)]
+    assert db.materialize_recurring(date(2024, 4, 29)) == 0
+    assert db.get_recurring(user)[0][7] == date(2024, 4, 30)
+    assert db.get_total_spent(user) == Decimal("90000.00")
+    assert [row for row in db.verify_summary() if row[0] == user] == []
+
+    assert db.delete_recurring(user, rule)
+    assert db.materialize_recurring(date(2024, 12, 31)) == 0
+
+
+def test_end_date_stops_rule(db, users):
+    user = users[0]
+    db.add_recurring(user, "Кофе", "150", "", None, "week", date(2024, 3, 1), date(2024, 3, 20))
+    assert db.materialize_recurring(date(2024, 6, 1)) == 3
+    assert dates(db, user) == [date(2024, 3, 1), date(2024, 3, 8), date(2024, 3, 15)]
+    rule = db.get_recurring(user)[0]
+    assert describe(rule) == "каждую неделю с 01.03.2024 по 20.03.2024"
+
+
+def test_rules_of_other_users_are_not_deleted(db, users):
+    owner, stranger = users
+    rule = db.add_recurring(owner, "Аренда", "30000", "", None, "month", date(2024, 1, 1))
+    assert not db.delete_recurring(stranger, rule)
+    assert len(db.get_recurring(owner)) == 1
+
+
+def test_scheduler_uses_injected_clock(db, users):
+    user = users[0]
+    db.add_recurring(user, "Проезд", "60", "", None, "day", date(2024, 5, 1))
+    today = [date(2024, 5, 3)]
+    model = AsyncDB(db)
+    scheduler = RecurringScheduler(model, clock=lambda: today[0])
+
+    async def run():
+        first = await scheduler.run_once()
+        today[0] = date(2024, 5, 5)
+        return first, await scheduler.run_once()
+
+    try:
+        assert asyncio.run(run()) == (3, 2)
+    finally:
+        model.executor.shutdown()
+        model.password_executor.shutdown()
+    assert dates(db, user)[-1] == date(2024, 5, 5)
@@ -0,0 +1,46 @@
+"""Кэш результатов get_dashboard: срок жизни записей и поколения."""
+from database import SearchCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = SearchCache(ttl=5.0, clock=clock)
+    key = (1, "", None, 50)
+    cache.put(key, "dashboard", cache.generation(1))
+    clock.now = 4.9
+    assert cache.get(key) == "dashboard"
+    clock.now = 5.0
+    assert cache.get(key) is None
+
+
+def test_result_of_query_started_before_change_is_dropped():
+    cache = SearchCache()
+    key = (1, "", None, 50)
+    generation = cache.generation(1)
+    cache.invalidate_user(1)
+    cache.put(key, "stale", generation)
+    assert cache.get(key) is None
+
+
+def test_clear_drops_entries_and_queries_in_flight():
+    clock = FakeClock()
+    cache = SearchCache(ttl=5.0, clock=clock)
+    cache.put((1, "", None, 50), "dashboard", cache.generation(1))
+    in_flight = cache.generation(2)
+
+    cache.clear()
+    cache.put((2, "", None, 50), "stale", in_flight)
+    assert cache.get((1, "", None, 50)) is None
+    assert cache.get((2, "", None, 50)) is None
+    # Подставные часы остаются после очистки
+    assert cache.clock is clock
+    cache.put((2, "", None, 50), "fresh", cache.generation(2))
+    assert cache.get((2, "", None, 50)) == "fresh"
@@ -0,0 +1,49 @@
+"""Токены сессий: срок действия и отзыв."""
+from sessions import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_expires_after_ttl_without_use():
+    clock = FakeClock()
+    sessions = SessionStore(ttl=60, clock=clock)
+    token = sessions.create(7)
+    clock.now = 59
+    assert sessions.get(token) == 7
+    clock.now = 59 + 60
+    assert sessions.get(token) is None
+    assert sessions.get(None) is None
+
+
+def test_use_extends_token():
+    clock = FakeClock()
+    sessions = SessionStore(ttl=60, clock=clock)
+    token = sessions.create(7)
+    for now in (50, 100, 150):
+        clock.now = now
+        assert sessions.get(token) == 7
+
+
+def test_expired_tokens_are_purged_on_create():
+    clock = FakeClock()
+    sessions = SessionStore(ttl=60, clock=clock)
+    sessions.create(1)
+    clock.now = 61
+    sessions.create(2)
+    assert len(sessions._sessions) == 1
+
+
+def test_revoke_user_ends_all_sessions():
+    sessions = SessionStore()
+    first, second, other = sessions.create(1), sessions.create(1), sessions.create(2)
+    sessions.revoke_user(1)
+    assert sessions.get(first) is None and sessions.get(second) is None
+    assert sessions.get(other) == 2
+    sessions.revoke(other)
+    assert sessions.get(other) is None
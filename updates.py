@@ -0,0 +1,74 @@
+"""Объединение обновлений страницы Flet.
+
+Каждый вызов page.update() отправляет клиенту изменения страницы. Методы
+представлений вызывают request_update(page), а команды контроллера выполняются
+внутри batched_updates(): тогда все изменения за команду уходят клиенту одним
+обновлением в ее конце. Вне пакета request_update() обновляет страницу сразу.
+
+Пакет хранится в переменной контекста, поэтому у каждой задачи asyncio (каждого
+обработчика события) он свой, и долгая команда не задерживает обновления других.
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+
+_batch = contextvars.ContextVar("page_update_batch", default=None)
+
+
+class _Batch:
+    """Страницы, ожидающие обновления в конце пакета.
+
+    Задачи, созданные внутри пакета, наследуют его вместе с контекстом; после
+    выхода из блока пакет закрыт, и в таких задачах обновления идут как вне пакета.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+
+def _open_batch():
+    batch = _batch.get()
+    return batch if batch is not None and not batch.closed else None
+
+
+def request_update(page):
+    """Обновляет страницу сразу или в конце текущего пакета."""
+    batch = _open_batch()
+    if batch is None:
+        page.update()
+    elif not any(pending is page for pending in batch.pages):
+        batch.pages.append(page)
+
+
+def flush_updates():
+    """Отправляет накопленные в пакете изменения, не дожидаясь его конца."""
+    batch = _batch.get()
+    while batch is not None and batch.pages:
+        batch.pages.pop(0).update()
+
+
+@contextmanager
+def batched_updates():
+    """Откладывает обновления страниц до выхода из блока; вложенные блоки входят во внешний."""
+    if _open_batch() is not None:
+        yield
+        return
+    batch = _Batch()
+    token = _batch.set(batch)
+    try:
+        yield
+    finally:
+        batch.closed = True
+        _batch.reset(token)
+        while batch.pages:
+            batch.pages.pop(0).update()
+
+
+def batched(func):
+    """Декоратор корутины, выполняющий ее внутри batched_updates()."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with batched_updates():
+            return await func(*args, **kwargs)
+    return wrapper
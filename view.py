@@ -1,5 +1,76 @@
+import asyncio
 import flet as ft
-from datetime import datetime
+from datetime import date, datetime
+
+from analytics_view import AnalyticsView
+from recurring_view import RecurringView
+from updates import flush_updates, request_update
+
+# Индикатор загрузки показывается, только если запрос идет дольше, в секундах
+LOADING_DELAY = 0.2
+
+# Сколько заглушек показывать в списке до загрузки записей
+SKELETON_ROWS = 6
+
+# Варианты повтора новой записи: период правила recurring или "none"
+REPEAT_OPTIONS = {
+    "none": "Не повторять",
+    "day": "Каждый день",
+    "week": "Каждую неделю",
+    "month": "Каждый месяц",
+}
+
+
+def to_date(value):
+    """Дата записи: MySQL возвращает date, SQLite и тестовые данные — строку YYYY-MM-DD."""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+class RowCard:
+    """Карточка записи в списке покупок.
+
+    Карточки кэшируются по buy.id: при обновлении списка изменившаяся запись
+    правит тексты своей карточки на месте, а не пересоздает ее.
+    Флажок отмечает запись для пакетных действий (BudgetView.selected_ids).
+    """
+
+    def __init__(self, view, row):
+        self.row = None
+        self.checkbox = ft.Checkbox(
+            value=row[0] in view.selected_ids,
+            active_color=view.accent_color,
+            on_change=lambda e: view.toggle_selection(self.row[0], e.control.value))
+        self.title = ft.Text(
+            color=view.text_color,
+            weight=ft.FontWeight.BOLD,
+            size=16)
+        self.subtitle = ft.Text(size=14)
+        self.control = ft.Card(
+            content=ft.Container(
+                content=ft.ListTile(
+                    leading=ft.Icon(ft.Icons.SHOPPING_CART, color=view.secondary_color),
+                    title=self.title,
+                    subtitle=self.subtitle,
+                    trailing=self.checkbox,
+                    on_click=lambda e: view.controller.select_row(self.row)),
+                padding=10,
+                bgcolor=view.card_color,
+                border_radius=8),
+            elevation=1,
+            color=view.secondary_color,
+            margin=ft.margin.symmetric(vertical=4))
+        self.set_row(row)
+
+    def set_row(self, row):
+        if row == self.row:
+            return
+        self.row = row
+        day = to_date(row[5])
+        date_str = day.strftime("%d.%m.%Y") if day else "Без даты"
+        self.title.value = f"{row[1]}"
+        self.subtitle.value = f"{row[2]} руб. • {date_str} • {row[3]} • {row[4]}"
 
 
 class BudgetView:
@@ -13,11 +84,20 @@ class BudgetView:
         self.accent_color = "#F7C548"
 
         self.selected_tuple = None
+        self.selected_ids = set()  # записи, отмеченные флажками
         self.selected_date = None
         self.page = None
+        self.row_cards = {}  # buy.id -> RowCard
+        self.analytics = AnalyticsView(self)
+        self.recurring = RecurringView(self)
 
     def setup_ui(self, page: ft.Page):
         self.page = page
+        # Состояние списка относится к вошедшему пользователю и строится заново
+        self.selected_tuple = None
+        self.selected_ids = set()
+        self.selected_date = None
+        self.row_cards = {}
         page.title = "Калькулятор, но не калькулятор клянусь"
         page.window_width = 800
         page.window_height = 600
@@ -41,7 +121,8 @@ class BudgetView:
             bgcolor=self.card_color,
             color=self.text_color,
             expand=True,
-            label_style=ft.TextStyle(color=self.text_color))
+            label_style=ft.TextStyle(color=self.text_color),
+            on_change=self.controller.live_search_command)
 
         self.price_text = ft.TextField(
             label="Стоимость",
@@ -81,6 +162,17 @@ class BudgetView:
                 shape=ft.RoundedRectangleBorder(radius=8)),
             on_click=self.open_date_picker)
 
+        # Повтор: добавленная запись становится повторяющимся расходом
+        self.repeat_dropdown = ft.Dropdown(
+            label="Повтор",
+            options=[ft.dropdown.Option(key, text) for key, text in REPEAT_OPTIONS.items()],
+            value="none",
+            border_color=self.secondary_color,
+            bgcolor=self.card_color,
+            color=self.text_color,
+            label_style=ft.TextStyle(color=self.text_color),
+            width=200)
+
         # Категории
         self.category_dropdown = ft.Dropdown(
             hint_text="Выберите категорию для фильтрации",
@@ -93,9 +185,16 @@ class BudgetView:
             color=self.text_color,
             label_style=ft.TextStyle(color=self.text_color),
             expand=True,
-            on_change=lambda e: self.controller.search_command(e)
+            on_change=self.controller.search_command
         )
 
+        # Поиск по мере ввода названия
+        self.live_search_switch = ft.Switch(
+            label="Живой поиск",
+            value=False,
+            active_color=self.accent_color,
+            label_style=ft.TextStyle(color=self.text_color))
+
         # Статистика
         self.stats_text = ft.Text(
             "Статистика: загрузка...",
@@ -103,8 +202,30 @@ class BudgetView:
             color=self.text_color,
             weight=ft.FontWeight.BOLD)
 
+        # Отмеченные записи
+        self.selection_text = ft.Text(size=14, color=self.text_color)
+        self.selection_row = ft.Row(
+            controls=[
+                self.selection_text,
+                ft.TextButton("Снять выбор", on_click=lambda e: self.clear_selection())],
+            visible=False)
+
+        # Индикатор выполнения запроса к базе
+        self.progress_bar = ft.ProgressBar(
+            color=self.accent_color,
+            bgcolor=self.card_color,
+            visible=False)
+        self.loading_count = 0
+        self.loading_timer = None
+
         # Список покупок
-        self.list_view = ft.ListView(expand=True, spacing=5)
+        self.list_view = ft.ListView(
+            expand=True,
+            spacing=5,
+            scroll_interval=100,
+            on_scroll=self.handle_scroll)
+        # До загрузки записей список занят заглушками (см. update_list)
+        self.list_view.controls = [self.skeleton_card() for _ in range(SKELETON_ROWS)]
         self.list_container = ft.Container(
             content=self.list_view,
             bgcolor=self.card_color,
@@ -127,22 +248,22 @@ class BudgetView:
                     "Посмотреть все",
                     style=button_style,
                     icon=ft.Icons.LIST,
-                    on_click=lambda e: self.controller.view_command(e)),
+                    on_click=self.controller.view_command),
                 ft.ElevatedButton(
                     "Поиск",
                     style=button_style,
                     icon=ft.Icons.SEARCH,
-                    on_click=lambda e: self.controller.search_command(e)),
+                    on_click=self.controller.search_command),
                 ft.ElevatedButton(
                     "Добавить",
                     style=button_style,
                     icon=ft.Icons.ADD,
-                    on_click=lambda e: self.controller.add_command(e)),
+                    on_click=self.controller.add_command),
                 ft.ElevatedButton(
                     "Обновить",
                     style=button_style,
                     icon=ft.Icons.UPDATE,
-                    on_click=lambda e: self.controller.update_command(e)),
+                    on_click=self.controller.update_command),
                 ft.ElevatedButton(
                     "Удалить",
                     style=ft.ButtonStyle(
@@ -152,10 +273,45 @@ class BudgetView:
                         padding=ft.padding.symmetric(horizontal=20, vertical=12),
                         shape=ft.RoundedRectangleBorder(radius=8)),
                     icon=ft.Icons.DELETE,
-                    on_click=lambda e: self.controller.delete_command(e))],
+                    on_click=self.controller.delete_command),
+                ft.ElevatedButton(
+                    "Сменить категорию",
+                    style=button_style,
+                    icon=ft.Icons.CATEGORY,
+                    on_click=self.controller.recategorize_command),
+                ft.ElevatedButton(
+                    "Повторы",
+                    style=button_style,
+                    icon=ft.Icons.REPEAT,
+                    on_click=self.controller.recurring_command),
+                ft.ElevatedButton(
+                    "Лимит",
+                    style=button_style,
+                    icon=ft.Icons.SAVINGS,
+                    tooltip="Месячный лимит выбранной категории из поля «Стоимость»",
+                    on_click=self.controller.limit_command),
+                ft.ElevatedButton(
+                    "Аналитика",
+                    style=button_style,
+                    icon=ft.Icons.BAR_CHART,
+                    on_click=self.controller.analytics_command),
+                ft.ElevatedButton(
+                    "Экспорт",
+                    style=button_style,
+                    icon=ft.Icons.DOWNLOAD,
+                    on_click=self.open_export_dialog),
+                ft.TextButton(
+                    "Выйти",
+                    icon=ft.Icons.LOGOUT,
+                    style=ft.ButtonStyle(color=self.text_color),
+                    on_click=self.controller.logout_command)],
             spacing=12,
             alignment=ft.MainAxisAlignment.CENTER)
 
+        # Выбор файла для выгрузки
+        self.export_picker = ft.FilePicker(on_result=self.handle_export_result)
+        page.overlay.append(self.export_picker)
+
         # Добавляем всё на страницу
         page.add(
             ft.Column([
@@ -172,10 +328,12 @@ class BudgetView:
                     controls=[self.comment_text, self.category_dropdown],
                     spacing=20),
                 ft.Row(
-                    controls=[self.date_button, self.date_text],
+                    controls=[self.date_button, self.date_text, self.repeat_dropdown, self.live_search_switch],
                     spacing=20),
                 ft.Divider(height=20, color=self.secondary_color),
                 self.stats_text,
+                self.progress_bar,
+                self.selection_row,
                 ft.Divider(height=20, color=self.secondary_color),
                 ft.Row(
                     controls=[
@@ -186,9 +344,14 @@ class BudgetView:
                     vertical_alignment=ft.CrossAxisAlignment.START)],
                 expand=True))
 
-        # Инициализация
-        self.update_category_dropdown()
-        self.controller.update_view()
+    def skeleton_card(self):
+        """Заглушка карточки записи на время первой загрузки списка."""
+        return ft.Container(
+            height=64,
+            bgcolor=self.primary_color,
+            opacity=0.4,
+            border_radius=8,
+            margin=ft.margin.symmetric(vertical=4))
 
     def open_date_picker(self, e):
         date_picker = ft.DatePicker(
@@ -201,63 +364,123 @@ class BudgetView:
     def handle_date_change(self, e):
         self.selected_date = e.control.value
         self.date_text.value = self.selected_date.strftime("%d.%m.%Y")
-        self.page.update()
+        request_update(self.page)
+
+    def open_export_dialog(self, e):
+        self.export_picker.save_file(
+            dialog_title="Выгрузка расходов",
+            file_name="expenses.csv",
+            allowed_extensions=["csv", "buycol"])
 
-    def update_category_dropdown(self):
-        categories = self.controller.get_categories()
+    async def handle_export_result(self, e):
+        if e.path:
+            await self.controller.export_command(e.path)
+
+    def update_category_dropdown(self, categories):
         self.category_dropdown.options = [ft.dropdown.Option("Все категории")] + [
             ft.dropdown.Option(cat[1]) for cat in categories
         ]
-        self.page.update()
+        request_update(self.page)
 
     def update_list(self, rows):
-        self.list_view.controls.clear()
+        """Показывает rows, переиспользуя карточки уже показанных записей.
+
+        Flet сравнивает новый список с прежним по элементам, поэтому клиенту
+        уходят только добавленные, удаленные и измененные карточки.
+        """
+        cards = {}
+        for row in rows:
+            card = self.row_cards.get(row[0])
+            if card is None:
+                card = RowCard(self, row)
+            else:
+                card.set_row(row)
+            cards[row[0]] = card
+        self.row_cards = cards
+        self.list_view.controls = [card.control for card in cards.values()]
+        # Отметки исчезнувших из списка записей снимаются
+        if not self.selected_ids <= cards.keys():
+            self.selected_ids &= cards.keys()
+            self.update_selection_text()
+        request_update(self.page)
+
+    def append_list(self, rows):
         for row in rows:
-            date_str = datetime.strptime(row[5], "%Y-%m-%d").strftime("%d.%m.%Y") if row[5] else "Без даты"
-            self.list_view.controls.append(
-                ft.Card(
-                    content=ft.Container(
-                        content=ft.ListTile(
-                            leading=ft.Icon(ft.Icons.SHOPPING_CART, color=self.secondary_color),
-                            title=ft.Text(
-                                f"{row[1]}",
-                                color=self.text_color,
-                                weight=ft.FontWeight.BOLD,
-                                size=16),
-                            subtitle=ft.Text(
-                                f"{row[2]} руб. • {date_str} • {row[3]} • {row[4]}",
-                                size=14),
-                            on_click=lambda e, row=row: self.controller.select_row(row)),
-                        padding=10,
-                        bgcolor=self.card_color,
-                        border_radius=8),
-                    elevation=1,
-                    color=self.secondary_color,
-                    margin=ft.margin.symmetric(vertical=4)))
-        self.page.update()
+            card = RowCard(self, row)
+            self.row_cards[row[0]] = card
+            self.list_view.controls.append(card.control)
+        request_update(self.page)
+
+    async def handle_scroll(self, e):
+        # Догружаем следующую страницу, когда до конца списка осталось меньше экрана
+        if e.max_scroll_extent is not None and e.pixels >= e.max_scroll_extent - 300:
+            await self.controller.load_more_command(e)
+
+    def set_loading(self, loading):
+        """Показывает индикатор, пока выполняется хотя бы один запрос.
+
+        Внутри команды изменения уходят клиенту одним обновлением в ее конце,
+        поэтому индикатор отправляется отдельно, только если запрос не успел
+        завершиться за LOADING_DELAY: быстрые команды обходятся одним обновлением.
+        """
+        self.loading_count += 1 if loading else -1
+        self.progress_bar.visible = self.loading_count > 0
+        if loading and self.loading_count == 1:
+            self.loading_timer = asyncio.get_running_loop().call_later(LOADING_DELAY, flush_updates)
+        elif not self.loading_count and self.loading_timer:
+            self.loading_timer.cancel()
+            self.loading_timer = None
+        request_update(self.page)
 
     def update_stats(self, total, top_category, top_amount):
         self.stats_text.value = (
             f"Всего потрачено: {total:.2f} руб. | "
             f"Больше всего потрачено на: {top_category} ({top_amount:.2f} руб.)"
         )
-        self.page.update()
+        request_update(self.page)
+
+    def show_analytics(self, report):
+        self.analytics.show(report)
+
+    def show_recurring(self, rules):
+        self.recurring.show(rules)
 
     def select_row(self, row):
         self.selected_tuple = row
         self.product_text.value = row[1]
-        self.price_text.value = row[2]
+        self.price_text.value = str(row[2])
         self.comment_text.value = row[3]
         self.category_dropdown.value = row[4] if row[4] else ""
 
         if row[5]:
-            self.selected_date = datetime.strptime(row[5], "%Y-%m-%d").date()
+            self.selected_date = to_date(row[5])
             self.date_text.value = self.selected_date.strftime("%d.%m.%Y")
         else:
             self.selected_date = None
             self.date_text.value = "Дата не выбрана"
 
-        self.page.update()
+        request_update(self.page)
+
+    def toggle_selection(self, id, selected):
+        if selected:
+            self.selected_ids.add(id)
+        else:
+            self.selected_ids.discard(id)
+        self.update_selection_text()
+        request_update(self.page)
+
+    def clear_selection(self):
+        for id in self.selected_ids:
+            card = self.row_cards.get(id)
+            if card:
+                card.checkbox.value = False
+        self.selected_ids = set()
+        self.update_selection_text()
+        request_update(self.page)
+
+    def update_selection_text(self):
+        self.selection_text.value = f"Выбрано записей: {len(self.selected_ids)}"
+        self.selection_row.visible = bool(self.selected_ids)
 
     def clear_fields(self):
         self.selected_tuple = None
@@ -266,10 +489,11 @@ class BudgetView:
         self.price_text.value = ""
         self.comment_text.value = ""
         self.category_dropdown.value = None
+        self.repeat_dropdown.value = "none"
         self.date_text.value = "Дата не выбрана"
-        self.page.update()
+        request_update(self.page)
 
     def show_snackbar(self, message):
         self.page.snack_bar = ft.SnackBar(ft.Text(message))
         self.page.snack_bar.open = True
-        self.page.update()
+        request_update(self.page)